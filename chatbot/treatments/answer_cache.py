@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import re
+
+from ttl_cache import TwoTierCache, CACHE_DIR
+
+# --- Deterministic answer cache for temperature-0 treatments ---
+ANSWER_CACHE = os.environ.get("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", os.path.join(CACHE_DIR, "answers.sqlite3"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", 30 * 24 * 3600))
+
+answer_cache = TwoTierCache("answer", ANSWER_CACHE_PATH, max_entries=2048, ttl=ANSWER_CACHE_TTL)
+
+REPLAY_RE = re.compile(r"\S+\s*|\s+")
+REPLAY_WORDS = 4  # words per streamed piece when replaying
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize(text: str) -> str:
+    return " ".join((text or "").split()).casefold()
+
+
+def cacheable(settings: dict) -> bool:
+    """Only deterministic settings can be replayed."""
+    return ANSWER_CACHE and settings.get("temperature") == 0
+
+
+def cache_key(treatment: str, settings: dict, system_prompt: str, messages, tool_payload: str = "") -> str:
+    """
+    Key on the treatment, the model settings (model, limits, tools), the system prompt hash,
+    the normalized conversation and the tool payload hash. Tool-call ids are random per
+    call and therefore left out.
+    """
+    conversation = [
+        {
+            "role": m["role"],
+            "content": normalize(m.get("content")),
+            "tool_calls": [tc["function"] for tc in m.get("tool_calls", [])],
+        }
+        for m in messages
+        if m["role"] not in ("system", "tool")
+    ]
+    parts = [
+        treatment,
+        json.dumps(settings, sort_keys=True),
+        _digest(system_prompt),
+        json.dumps(conversation, sort_keys=True),
+        _digest(tool_payload),
+    ]
+    return _digest("\x1f".join(parts))
+
+
+async def get(key: str):
+    return await answer_cache.get(key)
+
+
+def put(key: str, value):
+    answer_cache.set(key, value)
+
+
+async def replay(msg, text: str):
+    """Stream a cached answer through the normal msg.stream_token path, a few words at a time."""
+    pieces = REPLAY_RE.findall(text)
+    for i in range(0, len(pieces), REPLAY_WORDS):
+        await msg.stream_token("".join(pieces[i:i + REPLAY_WORDS]))
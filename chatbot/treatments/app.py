@@ -0,0 +1,51 @@
+import os
+from urllib.parse import urlparse, parse_qs
+
+import chainlit as cl
+from engine import TREATMENTS, DEFAULT_TREATMENT, treatment_by_code, respond
+import metrics
+
+# --- Single Chainlit app serving all treatments: chainlit run app.py ---
+# A participant is routed by the "tr" query parameter of the link from the survey (TR01 code 1-4 or
+# treatment name), otherwise by the chosen chat profile, otherwise to DEFAULT_TREATMENT.
+# TREATMENT_PROFILES=0 hides the profile picker, e.g. during the experiment.
+TREATMENT_PROFILES = os.environ.get("TREATMENT_PROFILES", "1") == "1"
+ASSIGNMENT_PARAM = "tr"
+
+PROFILE_NAMES = {treatment["label"]: name for name, treatment in TREATMENTS.items()}
+
+# Latency percentiles and pool/cache stats on METRICS_HOST:METRICS_PORT (/metrics, /metrics.json)
+metrics.serve()
+
+
+async def chat_profiles():
+    return [
+        cl.ChatProfile(name=treatment["label"], markdown_description=f"Treatment {treatment['code']}")
+        for treatment in TREATMENTS.values()
+    ]
+
+
+if TREATMENT_PROFILES:
+    cl.set_chat_profiles(chat_profiles)
+
+
+def assigned_treatment() -> str:
+    referer = getattr(cl.context.session, "http_referer", None) or ""
+    values = parse_qs(urlparse(referer).query).get(ASSIGNMENT_PARAM)
+    if values and (name := treatment_by_code(values[0])):
+        return name
+    profile = cl.user_session.get("chat_profile")
+    if profile in PROFILE_NAMES:
+        return PROFILE_NAMES[profile]
+    return DEFAULT_TREATMENT
+
+
+@cl.on_chat_start
+async def start():
+    cl.user_session.set("treatment", assigned_treatment())
+
+
+@cl.on_message
+async def main(message: cl.Message):
+    treatment = cl.user_session.get("treatment") or assigned_treatment()
+    await respond(treatment, message)
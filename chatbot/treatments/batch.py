@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # CSV output without pyarrow
+    pyarrow = None
+
+# --- Headless batch runs of the treatments for the offline evaluation ---
+#   python batch.py --treatments all --script experiment --replicates 5
+#   python batch.py --participants ../../evaluation/data/mi_dataset.csv
+# Conversations run concurrently through TreatmentEngine.run_turn, the same path as the
+# Chainlit apps, so the shared scheduler keeps every request within the rate limits
+# (OPENAI_RPM/OPENAI_TPM, or --rpm/--tpm). Finished conversations are appended to a
+# checkpoint file, so an interrupted run continues where it stopped. The result has one row
+# per turn: "NEW CASE NR" and TR01 join it with evaluation/data/mi_dataset.csv.
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SCRIPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "question_scripts.json")
+CASE_COLUMN = "NEW CASE NR"
+CODE_COLUMN = "TR01"
+STAGES = ("turn", "llm_ttft", "tool_args", "retrieval_wait", "followup_ttft", "lookup", "sparql")
+PROGRESS_EVERY = 25  # conversations
+
+
+class Sink:
+    """Stands in for cl.Message; run_turn returns the answer anyway."""
+
+    async def stream_token(self, token: str):
+        pass
+
+    async def update(self):
+        pass
+
+
+def load_questions(path: str, names) -> dict:
+    """Conversations by name: a JSON file of name -> messages, or a text file with one single-turn question per line."""
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            scripts = json.load(f)
+        unknown = [name for name in names if name not in scripts]
+        if unknown:
+            sys.exit(f"Unknown script(s) {unknown}, available: {', '.join(scripts)}")
+        return {name: scripts[name] for name in names}
+    with open(path, encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+    return {f"q{i:04d}": [question] for i, question in enumerate(questions)}
+
+
+def case_order(case):
+    """Sort key for case numbers: numeric ones in numeric order, then any others, then none."""
+    if case is None:
+        return (2, 0, "")
+    case = str(case)
+    return (0, int(case), "") if case.isdigit() else (1, 0, case)
+
+
+def load_participants(path: str, treatment_by_code):
+    """(case number, treatment) per participant; the imputed data repeats each case once per imputation."""
+    participants = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            treatment = treatment_by_code(row.get(CODE_COLUMN, ""))
+            if treatment and row.get(CASE_COLUMN):
+                participants.setdefault(row[CASE_COLUMN], treatment)
+    return sorted(participants.items(), key=lambda item: case_order(item[0]))
+
+
+def conversation_key(job: dict) -> str:
+    return f"{job['case']}|{job['treatment']}|{job['script']}|{job['replicate']}"
+
+
+def read_checkpoint(path: str):
+    """Rows of the conversations completed so far, and their keys."""
+    rows, done = [], set()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut off by an interrupted run
+                rows.extend(entry["rows"])
+                done.add(entry["key"])
+    return rows, done
+
+
+class BatchRunner:
+    def __init__(self, engine, checkpoint: str, concurrency: int, model: str):
+        self.engine = engine
+        self.checkpoint = open(checkpoint, "a", encoding="utf-8", buffering=1)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.model = model
+        self.completed = 0
+        self.failed = 0
+        self.turns = 0
+        self.started = time.monotonic()
+
+    async def run(self, jobs, total: int):
+        self.total = total
+        await asyncio.gather(*(self.conversation(job) for job in jobs))
+
+    async def conversation(self, job: dict):
+        import metrics
+
+        async with self.semaphore:
+            name = job["treatment"]
+            history = self.engine.new_history(name)
+            rows = []
+            try:
+                for turn, question in enumerate(job["questions"]):
+                    trace = metrics.Trace(name, batch=True)
+                    answer = await self.engine.run_turn(name, question, Sink(), history=history, trace=trace)
+                    rows.append(self.row(job, turn, question, answer, trace))
+                    self.turns += 1
+            except Exception as e:
+                # not checkpointed: the whole conversation runs again on the next start
+                self.failed += 1
+                print(f"[ERROR] {conversation_key(job)} failed at turn {len(rows)}: {type(e).__name__}: {e}")
+                return
+        self.checkpoint.write(json.dumps({"key": conversation_key(job), "rows": rows}, ensure_ascii=False) + "\n")
+        self.completed += 1
+        if self.completed % PROGRESS_EVERY == 0 or self.completed + self.failed == self.total:
+            elapsed = time.monotonic() - self.started
+            print(f"[DEBUG] {self.completed + self.failed}/{self.total} conversations, "
+                  f"{self.turns / elapsed:.2f} turns/s, {self.failed} failed")
+
+    def row(self, job: dict, turn: int, question: str, answer: str, trace) -> dict:
+        from payload import count_tokens
+
+        tool_calls = trace.details.get("tool_calls", [])
+        latency = {f"{stage}_s": None for stage in STAGES}
+        for span in trace.spans:
+            if span["stage"] in STAGES:
+                key = f"{span['stage']}_s"
+                latency[key] = round((latency[key] or 0) + span["seconds"], 4)  # lookup/sparql: summed per turn
+        return {
+            CASE_COLUMN: job["case"],
+            CODE_COLUMN: job["code"],
+            "treatment": job["treatment"],
+            "script": job["script"],
+            "replicate": job["replicate"],
+            "turn": turn,
+            "question": question,
+            "answer": answer,
+            "answer_tokens": count_tokens(answer),
+            "tool_queries": json.dumps([call["query"] for call in tool_calls], ensure_ascii=False),
+            "tool_payloads": json.dumps([call["content"] for call in tool_calls], ensure_ascii=False),
+            "tool_tokens": sum(call["tokens"] for call in tool_calls),
+            "cached": bool(trace.attrs.get("cached")),
+            "fallback": bool(trace.attrs.get("fallback")),  # no DBpedia result, answered without tools
+            "model": self.model,
+            **latency,
+            "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+
+    def close(self):
+        self.checkpoint.close()
+
+
+def write_table(rows, path: str):
+    """Parquet when the path says so (needs pyarrow), CSV otherwise."""
+    rows = sorted(rows, key=lambda r: (
+        case_order(r[CASE_COLUMN]), r["treatment"], r["script"], r["replicate"], r["turn"]
+    ))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith(".parquet"):
+        if pyarrow is None:
+            sys.exit("Parquet output needs pyarrow (pip install pyarrow), or write .csv")
+        pyarrow.parquet.write_table(pyarrow.Table.from_pylist(rows), path)
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [CASE_COLUMN, CODE_COLUMN])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless batch runs of the treatments for the evaluation")
+    parser.add_argument("--treatments", nargs="+", default=["all"], help="vanilla cot rag rag_cot, TR01 codes, or all")
+    parser.add_argument("--participants", help="mi_dataset.csv: one conversation per case, in the case's TR01 treatment")
+    parser.add_argument("--questions", default=SCRIPTS_PATH, help="JSON scripts, or a text file with one question per line")
+    parser.add_argument("--script", nargs="+", default=["experiment"], help="scripts of the JSON file to run")
+    parser.add_argument("--replicates", type=int, default=1, help="runs per conversation (with --no-cache they differ)")
+    parser.add_argument("--concurrency", type=int, default=32, help="conversations in flight")
+    parser.add_argument("--output", default=os.path.join(DATA_DIR, "batch_answers.parquet" if pyarrow else "batch_answers.csv"))
+    parser.add_argument("--checkpoint", help="default: OUTPUT.checkpoint.jsonl")
+    parser.add_argument("--restart", action="store_true", help="discard the checkpoint and start over")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the answer cache, every answer from the API")
+    parser.add_argument("--rpm", type=int, help="requests per minute for the scheduler (default: OPENAI_RPM or the model's limit)")
+    parser.add_argument("--tpm", type=int, help="tokens per minute for the scheduler")
+    args = parser.parse_args()
+
+    # read once at import by the modules below
+    os.environ.setdefault("TRACE_LOG", "")  # the output has the spans
+    os.environ.setdefault("STREAM_COALESCE", "0")  # nobody watches the stream
+    if args.no_cache:
+        os.environ["ANSWER_CACHE"] = "0"
+    if args.rpm:
+        os.environ["OPENAI_RPM"] = str(args.rpm)
+    if args.tpm:
+        os.environ["OPENAI_TPM"] = str(args.tpm)
+    from engine import TREATMENTS, BASE_SETTINGS, treatment_by_code, get_engine
+
+    treatments = list(TREATMENTS) if "all" in args.treatments else [treatment_by_code(t) for t in args.treatments]
+    if None in treatments:
+        sys.exit(f"Unknown treatment in {args.treatments}, expected {', '.join(TREATMENTS)}, 1-4 or all")
+    scripts = load_questions(args.questions, args.script)
+    if args.participants:
+        assignments = load_participants(args.participants, treatment_by_code)
+    else:
+        assignments = [(None, treatment) for treatment in treatments]
+
+    checkpoint = args.checkpoint or args.output + ".checkpoint.jsonl"
+    if args.restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    _rows, done = read_checkpoint(checkpoint)
+
+    jobs = []
+    for case, treatment in assignments:
+        for script, questions in scripts.items():
+            for replicate in range(args.replicates):
+                job = {
+                    "case": case, "code": TREATMENTS[treatment]["code"], "treatment": treatment,
+                    "script": script, "replicate": replicate, "questions": questions,
+                }
+                if conversation_key(job) not in done:
+                    jobs.append(job)
+    print(f"[DEBUG] {len(jobs)} conversations to run, {len(done)} done in {checkpoint}")
+
+    os.makedirs(os.path.dirname(checkpoint) or ".", exist_ok=True)
+
+    async def go():
+        runner = BatchRunner(get_engine(), checkpoint, args.concurrency, BASE_SETTINGS["model"])
+        try:
+            await runner.run(jobs, len(jobs))
+        finally:
+            runner.close()
+        return runner
+
+    runner = asyncio.run(go())
+    rows, _done = read_checkpoint(checkpoint)
+    write_table(rows, args.output)
+    print(f"Wrote {len(rows)} turns to {args.output}")
+    if runner.failed:
+        print(f"[WARN] {runner.failed} conversations failed; run again to retry them")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
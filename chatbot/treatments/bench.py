@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+# Benchmarks run on the fixture corpus only: no network, no cache files
+os.environ.setdefault("DBPEDIA_CACHE_PATH", "")
+
+from dbpedia_lookup import parse_lookup_xml, group_bindings, build_batch_query
+from dbpedia_stub import FixtureCorpus
+from tool_stream import ToolCallAccumulator
+from history import ConversationHistory
+from payload import compact_tool_content, count_tokens
+from ttl_cache import CACHE_DIR
+
+# --- Micro-benchmarks for the retrieval and streaming hot paths ---
+#   python bench.py                   compare against the baseline, exit 1 on a regression
+#   python bench.py --save-baseline   store the current numbers as the new baseline
+BASELINE_PATH = os.path.join(CACHE_DIR, "bench_baseline.json")  # per machine, timings don't travel
+THRESHOLD = 0.25  # allowed slowdown relative to the baseline
+SIZE_METRICS = ("tokens", "prompt_tokens")  # deterministic outputs, any growth is a regression
+ROUNDS = 7
+MIN_ROUND_TIME = 0.05  # seconds; iterations per round are scaled up to at least this
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """Register a setup function returning (callable to time, {size metric: value})."""
+    BENCHMARKS.append(func)
+    return func
+
+
+corpus = FixtureCorpus()
+ENTITIES = [
+    "http://dbpedia.org/resource/Albert_Einstein",
+    "http://dbpedia.org/resource/Marie_Curie",
+    "http://dbpedia.org/resource/Berlin",
+]
+
+
+def lookup_results():
+    """Tool results as dbpedia_lookup returns them for three entities."""
+    grouped = group_bindings(corpus.sparql(build_batch_query(ENTITIES))["results"]["bindings"], ENTITIES)
+    return [
+        {
+            "entity": uri,
+            "label": corpus.labels[uri],
+            "description": corpus.abstract(uri).split(". ")[0],
+            **grouped[uri],
+        }
+        for uri in ENTITIES
+    ]
+
+
+@benchmark
+def lookup_xml_parse():
+    xml = corpus.lookup_xml("Berlin Germany Paris France Mannheim University Einstein Curie", 10)
+    return lambda: parse_lookup_xml(xml), {"bytes": len(xml)}
+
+
+@benchmark
+def sparql_grouping():
+    bindings = corpus.sparql(build_batch_query(ENTITIES))["results"]["bindings"]
+    return lambda: group_bindings(bindings, ENTITIES), {"rows": len(bindings)}
+
+
+def tool_call_deltas(queries, piece: int = 4):
+    """Deltas as the API streams them: id and name first, then the arguments a few characters at a time."""
+    deltas = []
+    for index, query in enumerate(queries):
+        arguments = json.dumps({"query": query, "max_results": 3})
+        deltas.append(SimpleNamespace(
+            index=index, id=f"call_{index}", function=SimpleNamespace(name="dbpedia_lookup", arguments=""),
+        ))
+        for i in range(0, len(arguments), piece):
+            deltas.append(SimpleNamespace(
+                index=index, id=None, function=SimpleNamespace(name=None, arguments=arguments[i:i + piece]),
+            ))
+    return deltas
+
+
+@benchmark
+def tool_delta_accumulation():
+    deltas = tool_call_deltas(["Albert Einstein", "theory of relativity Nobel Prize", "University of Mannheim"])
+
+    def run():
+        fields = []
+        accumulator = ToolCallAccumulator(lambda slot, key, value: fields.append(value))
+        for delta in deltas:
+            accumulator.add([delta])
+        return fields
+
+    return run, {"deltas": len(deltas)}
+
+
+@benchmark
+def history_assembly():
+    system_prompt = "You are a helpful assistant. " * 40
+    question = "What is the capital of Germany and how many people live there today? " * 2
+    answer = corpus.abstract("http://dbpedia.org/resource/Berlin") * 3
+
+    def run():
+        history = ConversationHistory(budget=4000)
+        for _turn in range(20):
+            history.append("user", question)
+            history.append("assistant", answer)
+        return history.prompt(system_prompt)
+
+    messages = run()
+    return run, {"prompt_tokens": sum(count_tokens(m["content"]) for m in messages)}
+
+
+@benchmark
+def payload_serialization():
+    results = lookup_results()
+    content, tokens = compact_tool_content(results)
+    return lambda: compact_tool_content(results), {"tokens": tokens, "bytes": len(content.encode("utf-8"))}
+
+
+def measure(func, rounds: int = ROUNDS) -> dict:
+    """Median and best time per call over `rounds` rounds, each long enough to time reliably."""
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= MIN_ROUND_TIME:
+            break
+        iterations *= 2
+    per_call = [elapsed / iterations]
+    for _ in range(rounds - 1):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        per_call.append((time.perf_counter() - started) / iterations)
+    return {"median_us": statistics.median(per_call) * 1e6, "min_us": min(per_call) * 1e6, "iterations": iterations}
+
+
+def run_all(selected=None) -> dict:
+    results = {}
+    for setup in BENCHMARKS:
+        if selected and setup.__name__ not in selected:
+            continue
+        func, sizes = setup()
+        results[setup.__name__] = {**measure(func), **sizes}
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """
+    Regressions as (benchmark, metric, baseline, current). Time is compared on the best
+    round, which is far less noisy than the median; token counts must not grow at all.
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if current["min_us"] > base["min_us"] * (1 + threshold):
+            regressions.append((name, "min_us", base["min_us"], current["min_us"]))
+        for metric in SIZE_METRICS:
+            if metric in current and metric in base and current[metric] > base[metric]:
+                regressions.append((name, metric, base[metric], current[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for retrieval and streaming hot paths")
+    parser.add_argument("benchmarks", nargs="*", help=f"subset of: {', '.join(b.__name__ for b in BENCHMARKS)}")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = run_all(set(args.benchmarks))
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'benchmark':<26}{'best':>11}{'median':>11}{'baseline':>11}{'change':>9}  sizes")
+        for name, current in results.items():
+            base = baseline.get(name, {}).get("min_us")
+            change = f"{(current['min_us'] / base - 1) * 100:+.1f}%" if base else "-"
+            sizes = ", ".join(f"{k}={v}" for k, v in current.items() if not k.endswith("_us") and k != "iterations")
+            print(
+                f"{name:<26}{current['min_us']:>9.1f}us{current['median_us']:>9.1f}us"
+                f"{(f'{base:.1f}us' if base else '-'):>11}{change:>9}  {sizes}"
+            )
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({**baseline, **results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, metric, base, value in regressions:
+        limit = f"> {args.threshold:.0%}" if metric == "min_us" else "grew"
+        print(f"[REGRESSION] {name}.{metric}: {base:.1f} -> {value:.1f} ({limit})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
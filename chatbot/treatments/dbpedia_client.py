@@ -0,0 +1,337 @@
+import asyncio
+import contextvars
+import os
+import time
+
+import httpx
+
+from metrics import span
+
+# --- Shared async HTTP client for DBpedia Lookup + SPARQL ---
+# Base URLs can point at a mirror or at the local stand-in (dbpedia_stub.py)
+LOOKUP_BASE = os.environ.get("DBPEDIA_LOOKUP_BASE", "https://lookup.dbpedia.org").rstrip("/")
+SPARQL_BASE = os.environ.get("DBPEDIA_SPARQL_BASE", "https://dbpedia.org").rstrip("/")
+LOOKUP_URL = LOOKUP_BASE + "/api/search/KeywordSearch"
+SPARQL_URL = SPARQL_BASE + "/sparql"
+SPARQL_HEADERS = {"Accept": "application/sparql-results+json"}
+
+TIMEOUT = 10  # seconds per request, as before
+MAX_CONNECTIONS = 20  # shared by all sessions of this worker
+MAX_KEEPALIVE = 10
+MAX_IN_FLIGHT = int(os.environ.get("DBPEDIA_MAX_IN_FLIGHT", 8))  # outstanding requests per worker
+TURN_BUDGET = float(os.environ.get("DBPEDIA_TURN_BUDGET", 15))  # seconds from user message to tool result
+HEDGE_DELAY = float(os.environ.get("DBPEDIA_HEDGE_DELAY", 2.0))  # send a second SPARQL request after this
+BREAKER_THRESHOLD = 5  # consecutive failures before an endpoint is considered down
+BREAKER_COOLDOWN = 30  # seconds before a trial request is let through again
+
+_client = None
+
+
+class RetrievalUnavailable(Exception):
+    """Retrieval cannot finish in time - the turn should fall back right away."""
+
+
+class DeadlineExceeded(RetrievalUnavailable):
+    pass
+
+
+class CircuitOpenError(RetrievalUnavailable):
+    pass
+
+
+class Deadline:
+    """Latency budget of one turn; every request gets whatever time is left."""
+
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+    def timeout(self, cap: float) -> float:
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Retrieval budget of this turn is used up")
+        return min(cap, remaining)
+
+
+# Set by dbpedia_lookup for the duration of one call; inherited by the tasks it starts
+current_deadline = contextvars.ContextVar("dbpedia_deadline", default=None)
+
+
+class CircuitBreaker:
+    """
+    Opens after BREAKER_THRESHOLD consecutive failures of an endpoint. While open, requests
+    fail immediately; after the cooldown one trial request decides whether to close again.
+    """
+
+    def __init__(self, name: str, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.trips = 0
+
+    def check(self) -> bool:
+        """Raise while open; True if the caller is the half-open trial request."""
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at < self.cooldown or self.trial_running:
+            raise CircuitOpenError(f"{self.name} endpoint is unavailable (circuit open)")
+        self.trial_running = True  # half-open: let this one request through
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                self.trips += 1
+                print(f"[ERROR] {self.name} circuit opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"open": self.opened_at is not None, "failures": self.failures, "trips": self.trips}
+
+
+class RequestLimiter:
+    """
+    Process-wide cap on outstanding DBpedia requests. Waiters are served in FIFO order
+    (asyncio.Semaphore), which gives fair queueing and backpressure across sessions.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def __aenter__(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        started = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - started
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "requests": self.acquired,
+            "avg_wait_s": self.total_wait / self.acquired if self.acquired else 0.0,
+            "max_wait_s": self.max_wait,
+        }
+
+
+class SingleFlight:
+    """
+    Concurrent identical requests share one in-flight call. The call is only cancelled
+    when every caller waiting on it has been cancelled; it is forgotten before that, so a
+    new caller for the same key starts a fresh call instead of joining the cancelled one.
+    """
+
+    def __init__(self):
+        self.calls = {}  # key -> [task, number of waiters]
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key, fn):
+        call = self.calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(fn())
+            call = self.calls[key] = [task, 0]
+            task.add_done_callback(lambda _, call=call: self._forget(key, call))
+            self.started += 1
+        else:
+            self.shared += 1
+        call[1] += 1
+        try:
+            return await asyncio.shield(call[0])
+        except asyncio.CancelledError:
+            call[1] -= 1
+            if call[1] == 0:
+                self._forget(key, call)
+                call[0].cancel()
+            raise
+
+    def _forget(self, key, call):
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self.calls), "started": self.started, "shared": self.shared}
+
+
+limiter = RequestLimiter(MAX_IN_FLIGHT)
+single_flight = SingleFlight()
+breakers = {LOOKUP_URL: CircuitBreaker("Lookup"), SPARQL_URL: CircuitBreaker("SPARQL")}
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide AsyncClient. Connections are kept alive and reused
+    across turns and sessions, so only the first request pays the TLS handshake.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _is_endpoint_failure(error: Exception) -> bool:
+    """Timeouts, connection errors, 5xx and 429 count against the breaker; bad queries don't."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+async def _attempt(url, params, headers, as_json):
+    async with limiter:
+        response = await get_client().get(url, params=params, headers=headers, timeout=TIMEOUT)
+    response.raise_for_status()
+    return response.json() if as_json else response.text
+
+
+async def _hedged(url, params, headers, as_json):
+    """
+    Start a second identical request if the first has not answered after HEDGE_DELAY;
+    the first successful response wins. Whatever is still running when this returns,
+    fails or is cancelled gets cancelled, so no attempt keeps holding a limiter slot.
+    """
+    attempts = [asyncio.ensure_future(_attempt(url, params, headers, as_json))]
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=HEDGE_DELAY)
+        if done:
+            return attempts[0].result()
+
+        attempts.append(asyncio.ensure_future(_attempt(url, params, headers, as_json)))
+        pending = set(attempts)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # retrieved, so a losing attempt's error is not logged as unhandled
+
+
+async def _get(url: str, params: dict, headers: dict = None, as_json: bool = False, hedge: bool = False):
+    """
+    GET through the single-flight layer, the circuit breaker and the global limiter.
+    The shared call runs with the plain TIMEOUT; every caller waits for it only as long as
+    the deadline of its own turn allows, and the call is cancelled once no caller is left.
+    """
+    deadline = current_deadline.get()
+    breaker = breakers[url]
+
+    async def request():
+        trial = breaker.check()
+        try:
+            if hedge:
+                result = await _hedged(url, params, headers, as_json)
+            else:
+                result = await _attempt(url, params, headers, as_json)
+        except asyncio.CancelledError:
+            if trial:
+                breaker.trial_running = False  # no verdict; the next request may try
+            raise
+        except Exception as e:
+            if _is_endpoint_failure(e):
+                breaker.failure()
+            elif trial:
+                breaker.trial_running = False
+            raise
+        breaker.success()
+        return result
+
+    key = (url, tuple(sorted(params.items())))
+    if deadline is None:
+        return await single_flight.do(key, request)
+    try:
+        return await asyncio.wait_for(single_flight.do(key, request), deadline.timeout(TIMEOUT * 2))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Retrieval budget of this turn is used up")
+
+
+async def lookup_keyword(query: str, max_results: int) -> str:
+    """Call the DBpedia Lookup KeywordSearch API and return the raw XML."""
+    with span("lookup"):
+        return await _get(LOOKUP_URL, {"QueryString": query, "MaxHits": max_results})
+
+
+async def sparql_select(query: str) -> dict:
+    """Run a SELECT query against the DBpedia endpoint and return the JSON result."""
+    with span("sparql"):
+        return await _get(
+            SPARQL_URL,
+            {"query": query, "format": "application/sparql-results+json"},
+            headers=SPARQL_HEADERS,
+            as_json=True,
+            hedge=True,
+        )
+
+
+def client_stats() -> dict:
+    return {
+        "limiter": limiter.stats(),
+        "single_flight": single_flight.stats(),
+        "breakers": {breaker.name: breaker.stats() for breaker in breakers.values()},
+    }
+
+
+async def gather_limited(coros, limit: int):
+    """Await coroutines concurrently, with at most `limit` in flight at once."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros))
@@ -0,0 +1,179 @@
+import argparse
+import math
+import os
+import re
+import sqlite3
+import time
+from urllib.parse import unquote
+
+from dbpedia_store import DATA_DIR, parse_ntriple, open_dump
+
+# --- Local entity index: replaces the Lookup KeywordSearch call with SQLite FTS5 ---
+INDEX_PATH = os.environ.get("DBPEDIA_INDEX_PATH", os.path.join(DATA_DIR, "dbpedia_index.sqlite3"))
+
+RESOURCE_PREFIX = "http://dbpedia.org/resource/"
+LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+COMMENT = "http://www.w3.org/2000/01/rdf-schema#comment"
+REDIRECTS = "http://dbpedia.org/ontology/wikiPageRedirects"
+WIKI_LINK = "http://dbpedia.org/ontology/wikiPageWikiLink"
+
+CANDIDATES = 50  # FTS hits re-ranked by popularity
+POPULARITY_WEIGHT = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    uri TEXT PRIMARY KEY,
+    label TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    popularity INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS aliases (
+    source TEXT PRIMARY KEY,
+    target TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(name, uri UNINDEXED, tokenize = 'unicode61 remove_diacritics 2');
+"""
+
+
+def name_from_uri(uri: str) -> str:
+    """http://dbpedia.org/resource/Battle_of_Britain -> 'Battle of Britain'"""
+    return unquote(uri[len(RESOURCE_PREFIX):]).replace("_", " ")
+
+
+def build(db_path: str, dump_paths, batch_size: int = 50000):
+    """
+    Stream labels, short abstracts (rdfs:comment), redirects and optionally page links
+    into the index. Redirect sources become alias names of their target; popularity is
+    the number of redirects plus incoming page links.
+    """
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(SCHEMA)
+
+    labels, comments, aliases, popular = [], [], [], []
+    started = time.time()
+
+    def flush():
+        conn.executemany(
+            "INSERT INTO entities (uri, label) VALUES (?, ?) "
+            "ON CONFLICT (uri) DO UPDATE SET label = excluded.label", labels)
+        conn.executemany(
+            "INSERT INTO entities (uri, description) VALUES (?, ?) "
+            "ON CONFLICT (uri) DO UPDATE SET description = excluded.description", comments)
+        conn.executemany("INSERT OR IGNORE INTO aliases VALUES (?, ?)", aliases)
+        conn.executemany(
+            "INSERT INTO entities (uri, popularity) VALUES (?, 1) "
+            "ON CONFLICT (uri) DO UPDATE SET popularity = popularity + 1", popular)
+        conn.commit()
+        for rows in (labels, comments, aliases, popular):
+            rows.clear()
+
+    for dump_path in dump_paths:
+        with open_dump(dump_path) as dump:
+            for line in dump:
+                triple = parse_ntriple(line)
+                if triple is None:
+                    continue
+                s, p, o, lang = triple
+                if not s.startswith(RESOURCE_PREFIX):
+                    continue
+                if p == LABEL and lang == "en":
+                    labels.append((s, o))
+                elif p == COMMENT and lang == "en":
+                    comments.append((s, o))
+                elif p == REDIRECTS:
+                    aliases.append((s, o))
+                    popular.append((o,))
+                elif p == WIKI_LINK:
+                    popular.append((o,))
+                else:
+                    continue
+                if len(labels) + len(comments) + len(aliases) + len(popular) >= batch_size:
+                    flush()
+        print(f"[INFO] Indexed {dump_path} ({time.time() - started:.0f}s)")
+    flush()
+
+    # Redirect pages are names, not entities of their own
+    conn.execute("DELETE FROM entities WHERE uri IN (SELECT source FROM aliases)")
+    conn.execute("DELETE FROM names")
+    conn.execute("INSERT INTO names (name, uri) SELECT label, uri FROM entities WHERE label != ''")
+    rows = conn.execute("SELECT source, target FROM aliases")
+    while batch := rows.fetchmany(batch_size):
+        conn.executemany(
+            "INSERT INTO names (name, uri) VALUES (?, ?)",
+            [(name_from_uri(source), target) for source, target in batch],
+        )
+    conn.execute("INSERT INTO names (names) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+
+
+def fts_query(query: str, operator: str) -> str:
+    tokens = re.findall(r"\w+", query.lower())
+    if not tokens:
+        return ""
+    terms = [f'"{t}"' for t in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    return f" {operator} ".join(terms)
+
+
+class EntityIndex:
+    """Offline KeywordSearch: returns docs in the same shape as the Lookup XML parser."""
+
+    def __init__(self, db_path: str = INDEX_PATH):
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+
+    def search(self, query: str, max_results: int = 3):
+        # All terms first; if that finds nothing, any term
+        for operator in ("AND", "OR"):
+            match = fts_query(query, operator)
+            if not match:
+                return []
+            rows = self.conn.execute(
+                """SELECT names.uri, bm25(names), e.label, e.description, e.popularity
+                   FROM names JOIN entities e ON e.uri = names.uri
+                   WHERE names MATCH ? ORDER BY bm25(names) LIMIT ?""",
+                (match, CANDIDATES),
+            ).fetchall()
+            if rows:
+                break
+
+        # bm25 is lower-is-better; popular entities get pulled up
+        best = {}
+        for uri, score, label, description, popularity in rows:
+            score -= POPULARITY_WEIGHT * math.log1p(popularity)
+            if uri not in best or score < best[uri][0]:
+                best[uri] = (score, label, description)
+        ranked = sorted(best.items(), key=lambda item: item[1][0])[:max_results]
+        return [
+            {
+                "resource": [uri],
+                "label": [label or name_from_uri(uri)],
+                "description": [description],
+            }
+            for uri, (_score, label, description) in ranked
+        ]
+
+    def label(self, uri: str):
+        row = self.conn.execute("SELECT label FROM entities WHERE uri = ?", (uri,)).fetchone()
+        return row[0] if row and row[0] else None
+
+
+_index = None
+
+
+def get_index() -> EntityIndex:
+    global _index
+    if _index is None:
+        _index = EntityIndex(INDEX_PATH)
+    return _index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local entity index from DBpedia dumps.")
+    parser.add_argument("dumps", nargs="+", help="labels, short abstracts, redirects and page links dumps")
+    parser.add_argument("--db", default=INDEX_PATH, help="SQLite index to create or extend")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    args = parser.parse_args()
+    build(args.db, args.dumps, args.batch_size)
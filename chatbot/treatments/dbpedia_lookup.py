@@ -1,34 +1,332 @@
-import requests
 import json
+import os
 import xml.etree.ElementTree as ET
 from collections import defaultdict
 
+from dbpedia_client import (
+    lookup_keyword, sparql_select, gather_limited, current_deadline, RetrievalUnavailable
+)
+from ttl_cache import TwoTierCache, CACHE_DIR
+
+MAX_PARALLEL_QUERIES = 6  # abstract + props for 3 entities at once
+MAX_PROPERTIES = 5
+MAX_VALUES = 5
+
+# "batched": one SPARQL query for all entities; "per_entity": abstract + props query per entity
+SPARQL_MODE = os.environ.get("DBPEDIA_SPARQL_MODE", "batched")
+
+# "remote": public SPARQL endpoint; "local": triple store built with dbpedia_store.py
+BACKEND = os.environ.get("DBPEDIA_BACKEND", "remote")
+# "remote": Lookup KeywordSearch API; "local": entity index built with dbpedia_index.py
+LOOKUP_BACKEND = os.environ.get("DBPEDIA_LOOKUP_BACKEND", "remote")
+
+ABSTRACT = "http://dbpedia.org/ontology/abstract"
+
+# Wiki bookkeeping properties the system prompt tells the model to ignore anyway
+IGNORED_PROPERTIES = [
+    ABSTRACT,
+    "http://dbpedia.org/ontology/wikiPageWikiLink",
+    "http://dbpedia.org/ontology/wikiPageExternalLink",
+    "http://dbpedia.org/ontology/wikiPageID",
+    "http://dbpedia.org/ontology/wikiPageLength",
+    "http://dbpedia.org/ontology/wikiPageRevisionID",
+    "http://dbpedia.org/ontology/wikiPageRedirects",
+    "http://dbpedia.org/ontology/wikiPageDisambiguates",
+    "http://dbpedia.org/ontology/thumbnail",
+]
+BATCH_ROW_LIMIT = 1000
+
+RESOURCE_PREFIX = "http://dbpedia.org/resource/"
+# Pair resource URIs among the property values with their English rdfs:label
+RESOLVE_LABELS = os.environ.get("DBPEDIA_RESOLVE_LABELS", "1") == "1"
+
+# Lookup hits are keyed on (normalized query, max_results), entity details on the URI.
+# DBPEDIA_CACHE_PATH="" keeps the cache in memory only; DBPEDIA_CACHE=0 turns it off
+# entirely, so every lookup goes to the endpoints (e.g. for load tests of retrieval).
+CACHE_ENABLED = os.environ.get("DBPEDIA_CACHE", "1") == "1"
+CACHE_PATH = os.environ.get("DBPEDIA_CACHE_PATH", os.path.join(CACHE_DIR, "dbpedia.sqlite3"))
+CACHE_TTL = float(os.environ.get("DBPEDIA_CACHE_TTL", 7 * 24 * 3600))
+
+
+def _cache(namespace: str, max_entries: int, ttl: float) -> TwoTierCache:
+    if not CACHE_ENABLED:
+        return TwoTierCache(namespace, None, max_entries=0, ttl=ttl)
+    return TwoTierCache(namespace, CACHE_PATH, max_entries=max_entries, ttl=ttl)
+
+
+lookup_cache = _cache("lookup", 2048, CACHE_TTL)
+entity_cache = _cache("entity", 4096, CACHE_TTL)
+# Labels practically never change, so they are kept much longer
+label_cache = _cache("label", 50000, 10 * CACHE_TTL)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def cache_stats() -> dict:
+    return {"lookup": lookup_cache.stats(), "entity": entity_cache.stats(), "label": label_cache.stats()}
+
+
+def parse_lookup_xml(xml_text: str):
+    """Turn a Lookup KeywordSearch XML response into a list of result docs."""
+    root = ET.fromstring(xml_text)
+    docs = []
+    for result in root.findall(".//Result"):
+        uri = result.findtext("URI")
+        label = result.findtext("Label")
+        description = result.findtext("Description")
+        if uri:
+            docs.append({
+                "resource": [uri],
+                "label": [label if label else ""],
+                "description": [description if description else ""]
+            })
+    return docs
+
+
+async def fetch_abstract(entity_uri: str) -> str:
+    # Query dbo:abstract (English)
+    sparql_abstract = f"""
+    SELECT ?abstract WHERE {{
+        <{entity_uri}> dbo:abstract ?abstract .
+        FILTER (lang(?abstract) = 'en')
+    }} LIMIT 1
+    """
+    try:
+        abstract_data = await sparql_select(sparql_abstract)
+        return (
+            abstract_data["results"]["bindings"][0]["abstract"]["value"]
+            if abstract_data["results"]["bindings"]
+            else ""
+        )
+    except RetrievalUnavailable:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Abstract query failed for {entity_uri}: {str(e)}")
+        return None
+
+
+async def fetch_properties(entity_uri: str) -> dict:
+    # Query ontology/resource properties
+    sparql_props = f"""
+    SELECT ?p ?o WHERE {{
+        <{entity_uri}> ?p ?o .
+        FILTER (
+            STRSTARTS(STR(?p), "http://dbpedia.org/ontology/") ||
+            STRSTARTS(STR(?p), "http://dbpedia.org/resource/")
+        )
+    }} LIMIT 50
+    """
+    props = defaultdict(list)
+    try:
+        props_data = await sparql_select(sparql_props)
+        for binding in props_data["results"]["bindings"]:
+            p = binding["p"]["value"]
+            o = binding["o"]["value"]
+            if len(props[p]) < MAX_VALUES:  # keep up to 5 values per property
+                props[p].append(o)
+    except RetrievalUnavailable:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Props query failed for {entity_uri}: {str(e)}")
+        return None
+
+    # Select up to 5 properties
+    return dict(list(props.items())[:MAX_PROPERTIES])
+
+
+def build_batch_query(entity_uris) -> str:
+    """One query for the English abstract and the filtered properties of all entities."""
+    values = " ".join(f"<{uri}>" for uri in entity_uris)
+    ignored = ", ".join(f"<{p}>" for p in IGNORED_PROPERTIES)
+    return f"""
+    SELECT ?s ?p ?o WHERE {{
+        VALUES ?s {{ {values} }}
+        {{
+            ?s dbo:abstract ?o .
+            FILTER (lang(?o) = 'en')
+            BIND (dbo:abstract AS ?p)
+        }}
+        UNION
+        {{
+            ?s ?p ?o .
+            FILTER (
+                STRSTARTS(STR(?p), "http://dbpedia.org/ontology/") ||
+                STRSTARTS(STR(?p), "http://dbpedia.org/resource/")
+            )
+            FILTER (?p NOT IN ({ignored}))
+            FILTER (!isLiteral(?o) || lang(?o) = '' || lang(?o) = 'en')
+        }}
+    }} LIMIT {BATCH_ROW_LIMIT}
+    """
+
+
+def group_triples(triples, entity_uris) -> dict:
+    """
+    Group (s, p, o) rows per entity into {"abstract": str, "properties": {p: [o, ...]}},
+    keeping up to 5 properties with up to 5 values each.
+    """
+    grouped = {uri: {"abstract": "", "properties": {}} for uri in entity_uris}
+    for s, p, o in triples:
+        entry = grouped.get(s)
+        if entry is None:
+            continue
+        if p == ABSTRACT:
+            if not entry["abstract"]:
+                entry["abstract"] = o
+            continue
+        props = entry["properties"]
+        if p not in props:
+            if len(props) >= MAX_PROPERTIES:
+                continue
+            props[p] = []
+        if len(props[p]) < MAX_VALUES:
+            props[p].append(o)
+    return grouped
+
+
+def group_bindings(bindings, entity_uris) -> dict:
+    return group_triples(
+        ((b["s"]["value"], b["p"]["value"], b["o"]["value"]) for b in bindings), entity_uris
+    )
+
+
+# Entity fetchers return ({uri: {"abstract", "properties"}}, {uris that failed}).
+# Failed entities are filled with empty values and never cached.
+async def fetch_entities_batched(entity_uris):
+    try:
+        data = await sparql_select(build_batch_query(entity_uris))
+        return group_bindings(data["results"]["bindings"], entity_uris), set()
+    except RetrievalUnavailable:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Batched query failed for {', '.join(entity_uris)}: {str(e)}")
+        return {uri: {"abstract": "", "properties": {}} for uri in entity_uris}, set(entity_uris)
+
+
+async def fetch_entities_per_entity(entity_uris):
+    fetched = await gather_limited(
+        [fetch_abstract(uri) for uri in entity_uris] + [fetch_properties(uri) for uri in entity_uris],
+        MAX_PARALLEL_QUERIES,
+    )
+    abstracts, properties = fetched[:len(entity_uris)], fetched[len(entity_uris):]
+    details, failed = {}, set()
+    for uri, abstract, props in zip(entity_uris, abstracts, properties):
+        if abstract is None or props is None:
+            failed.add(uri)
+        details[uri] = {"abstract": abstract or "", "properties": props or {}}
+    return details, failed
+
+
+async def fetch_entities(entity_uris) -> dict:
+    """Serve entity details from the cache and fetch only the missing ones."""
+    if BACKEND == "local":
+        import dbpedia_store
+        return group_triples(dbpedia_store.get_store().triples(entity_uris), entity_uris)
+
+    details = await entity_cache.get_many(entity_uris)
+    missing = [uri for uri in entity_uris if uri not in details]
+    if not missing:
+        return details
+
+    if SPARQL_MODE == "per_entity":
+        fetched, failed = await fetch_entities_per_entity(missing)
+    else:
+        fetched, failed = await fetch_entities_batched(missing)
+    for uri, detail in fetched.items():
+        if uri not in failed:
+            entity_cache.set(uri, detail)
+    details.update(fetched)
+    return details
+
+
+async def lookup_entities(query: str, max_results: int):
+    """Lookup docs for a query, from the cache when this query was seen before."""
+    if LOOKUP_BACKEND == "local":
+        import dbpedia_index
+        return dbpedia_index.get_index().search(query, max_results)
+
+    key = f"{normalize_query(query)}|{max_results}"
+    docs = await lookup_cache.get(key)
+    if docs is None:
+        docs = parse_lookup_xml(await lookup_keyword(query, max_results))
+        if docs:
+            lookup_cache.set(key, docs)
+    return docs
+
+
+def build_label_query(uris) -> str:
+    values = " ".join(f"<{uri}>" for uri in uris)
+    return f"""
+    SELECT ?s ?label WHERE {{
+        VALUES ?s {{ {values} }}
+        ?s rdfs:label ?label .
+        FILTER (lang(?label) = 'en')
+    }}
+    """
+
+
+async def resolve_labels(details) -> dict:
+    """
+    Map every resource URI among the property values of all entities to its English
+    label: from the label cache, else from the local index or triple store when one is
+    used, else with one batched SPARQL query. URIs without a label get a name derived
+    from the URI.
+    """
+    import dbpedia_index
+
+    uris = {
+        o
+        for detail in details.values()
+        for values in detail["properties"].values()
+        for o in values
+        if o.startswith(RESOURCE_PREFIX)
+    }
+    labels = await label_cache.get_many(list(uris))
+    missing = [uri for uri in uris if uri not in labels]
+    if not missing:
+        return labels
+
+    if LOOKUP_BACKEND == "local":
+        index = dbpedia_index.get_index()
+        fetched = {uri: index.label(uri) for uri in missing}
+    elif BACKEND == "local":
+        # the entities came from the triple store; no round trip to the public endpoint for their labels
+        import dbpedia_store
+        fetched = dbpedia_store.get_store().labels(missing)
+    else:
+        try:
+            data = await sparql_select(build_label_query(missing))
+        except Exception as e:
+            print(f"[ERROR] Label query failed: {str(e)}")
+            return labels
+        fetched = {b["s"]["value"]: b["label"]["value"] for b in data["results"]["bindings"]}
+
+    for uri in missing:
+        label = fetched.get(uri) or dbpedia_index.name_from_uri(uri)
+        label_cache.set(uri, label)
+        labels[uri] = label
+    return labels
+
+
 # --- DBpedia Lookup + SPARQL Tool (Top 3 results, up to 5 props × 5 values) ---
-async def dbpedia_lookup(query: str, max_results: int = 3):
+async def dbpedia_lookup(query: str, max_results: int = 3, deadline=None):
     """
-    Query DBpedia Lookup API (XML) and fetch dbo:abstract + up to 5 relevant properties 
+    Query DBpedia Lookup API (XML) and fetch dbo:abstract + up to 5 relevant properties
     (each with up to 5 values) for the top 3 entities via SPARQL.
+    Lookup hits and entity details are cached, so repeat questions skip the network.
+    Resource URIs among the property values are resolved to {"label", "uri"}, so the
+    model reads names and can still cite the DBpedia URL.
+    In batched mode all entities are fetched with a single query; in per-entity mode the
+    abstract and property queries of one turn run concurrently on the shared client.
+    With a deadline, every sub-query gets the time left of the turn's budget; an exhausted
+    budget or an open circuit breaker returns an error right away, so the caller falls back.
     """
-    lookup_url = "https://lookup.dbpedia.org/api/search/KeywordSearch"
-    params = {"QueryString": query, "MaxHits": max_results}
-
+    token = current_deadline.set(deadline)
     try:
         # Step 1: Lookup (XML response)
-        response = requests.get(lookup_url, params=params, timeout=10)
-        response.raise_for_status()
-
-        root = ET.fromstring(response.text)
-        docs = []
-        for result in root.findall(".//Result"):
-            uri = result.findtext("URI")
-            label = result.findtext("Label")
-            description = result.findtext("Description")
-            if uri:
-                docs.append({
-                    "resource": [uri],
-                    "label": [label if label else ""],
-                    "description": [description if description else ""]
-                })
+        docs = await lookup_entities(query, max_results)
 
         if not docs:
             return json.dumps({"error": "No DBpedia result"})
@@ -38,78 +336,25 @@ async def dbpedia_lookup(query: str, max_results: int = 3):
         for d in docs[:max_results]:
             print(f" - {d['label'][0]} ({d['resource'][0]})")
 
-        results = []
-
         # Step 2: Process top entities (up to 3)
-        for doc in docs[:max_results]:
-            entity_uri = doc["resource"][0]
-            label = doc.get("label", [""])[0]
-            description = doc.get("description", [""])[0]
-
-            sparql_url = "https://dbpedia.org/sparql"
-            headers_sparql = {"Accept": "application/sparql-results+json"}
-
-            # Query dbo:abstract (English)
-            sparql_abstract = f"""
-            SELECT ?abstract WHERE {{
-                <{entity_uri}> dbo:abstract ?abstract .
-                FILTER (lang(?abstract) = 'en')
-            }} LIMIT 1
-            """
-            try:
-                abstract_resp = requests.get(
-                    sparql_url,
-                    params={"query": sparql_abstract, "format": "application/sparql-results+json"},
-                    headers=headers_sparql,
-                    timeout=10,
-                )
-                abstract_data = abstract_resp.json()
-                abstract = (
-                    abstract_data["results"]["bindings"][0]["abstract"]["value"]
-                    if abstract_data["results"]["bindings"]
-                    else ""
-                )
-            except Exception as e:
-                abstract = ""
-                print(f"[ERROR] Abstract query failed for {entity_uri}: {str(e)}")
-
-            # Query ontology/resource properties
-            sparql_props = f"""
-            SELECT ?p ?o WHERE {{
-                <{entity_uri}> ?p ?o .
-                FILTER (
-                    STRSTARTS(STR(?p), "http://dbpedia.org/ontology/") ||
-                    STRSTARTS(STR(?p), "http://dbpedia.org/resource/")
-                )
-            }} LIMIT 50
-            """
-            props = defaultdict(list)
-            try:
-                props_resp = requests.get(
-                    sparql_url,
-                    params={"query": sparql_props, "format": "application/sparql-results+json"},
-                    headers=headers_sparql,
-                    timeout=10,
-                )
-                props_data = props_resp.json()
-                for binding in props_data["results"]["bindings"]:
-                    p = binding["p"]["value"]
-                    o = binding["o"]["value"]
-                    if len(props[p]) < 5:  # keep up to 5 values per property
-                        props[p].append(o)
-            except Exception as e:
-                print(f"[ERROR] Props query failed for {entity_uri}: {str(e)}")
-
-            # Select up to 5 properties
-            selected_props = dict(list(props.items())[:5])
+        top_docs = docs[:max_results]
+        uris = [doc["resource"][0] for doc in top_docs]
+        details = await fetch_entities(uris)
+        labels = await resolve_labels(details) if RESOLVE_LABELS else {}
 
+        results = []
+        for doc in top_docs:
+            entity_uri = doc["resource"][0]
             results.append(
                 {
                     "entity": entity_uri,
-                    "label": label,
-                    "description": description,
-                    "abstract": abstract,
-                    "properties": selected_props,
+                    "label": doc.get("label", [""])[0],
+                    "description": doc.get("description", [""])[0],
+                    "abstract": details[entity_uri]["abstract"],
+                    "properties": {
+                        p: [{"label": labels[o], "uri": o} if o in labels else o for o in values]
+                        for p, values in details[entity_uri]["properties"].items()
+                    },
                 }
             )
 
@@ -117,3 +362,6 @@ async def dbpedia_lookup(query: str, max_results: int = 3):
 
     except Exception as e:
         return json.dumps({"error": f"Lookup request failed: {str(e)}"})
+
+    finally:
+        current_deadline.reset(token)
@@ -0,0 +1,196 @@
+import argparse
+import bz2
+import gzip
+import os
+import re
+import sqlite3
+import time
+
+from dbpedia_lookup import ABSTRACT, IGNORED_PROPERTIES
+
+# --- Local DBpedia triple store: abstracts + ontology properties keyed by subject URI ---
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+STORE_PATH = os.environ.get("DBPEDIA_STORE_PATH", os.path.join(DATA_DIR, "dbpedia_store.sqlite3"))
+
+PROPERTY_PREFIXES = ("http://dbpedia.org/ontology/", "http://dbpedia.org/resource/")
+LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+IGNORED = frozenset(IGNORED_PROPERTIES)
+ROWS_PER_ENTITY = 500  # more than enough for 5 properties x 5 values
+
+TRIPLE_RE = re.compile(r'^<([^>]*)>\s+<([^>]*)>\s+(.+?)\s*\.\s*$')
+LITERAL_RE = re.compile(r'^"((?:[^"\\]|\\.)*)"(?:@([A-Za-z0-9\-]+)|\^\^<([^>]*)>)?$')
+ESCAPE_RE = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+ESCAPES = {"t": "\t", "b": "\b", "n": "\n", "r": "\r", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS abstracts (
+    subject TEXT PRIMARY KEY,
+    abstract TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS properties (
+    subject TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    predicate TEXT NOT NULL,
+    object TEXT NOT NULL,
+    PRIMARY KEY (subject, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS labels (
+    subject TEXT PRIMARY KEY,
+    label TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _unescape(match):
+    code = match.group(1)
+    if code[0] in "uU":
+        return chr(int(code[1:], 16))
+    return ESCAPES.get(code, code)
+
+
+def parse_ntriple(line: str):
+    """
+    Parse one N-Triples line into (subject, predicate, object, lang) or None.
+    Literal objects are unescaped; lang is None for IRIs and "" for untagged literals.
+    """
+    match = TRIPLE_RE.match(line)
+    if not match:
+        return None
+    s, p, o = match.groups()
+    if o.startswith("<") and o.endswith(">"):
+        return s, p, o[1:-1], None
+    literal = LITERAL_RE.match(o)
+    if not literal:
+        return None  # blank nodes are not needed
+    value, lang, _datatype = literal.groups()
+    if "\\" in value:
+        value = ESCAPE_RE.sub(_unescape, value)
+    return s, p, value, (lang or "").lower()
+
+
+def open_dump(path: str):
+    """Open a (possibly compressed) dump as a text stream, line by line."""
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def ingest(db_path: str, dump_paths, batch_size: int = 50000):
+    """
+    Stream N-Triples dumps into the store. Only English abstracts, English labels (for the
+    resource values of properties) and ontology/resource properties with English or
+    untagged literals are kept. Rows are written in batches, so memory use stays flat
+    regardless of the dump size.
+    """
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(SCHEMA)
+    seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM properties").fetchone()[0]
+
+    abstracts, properties, labels = [], [], []
+    kept = skipped = 0
+    started = time.time()
+
+    def flush():
+        conn.executemany("INSERT OR IGNORE INTO abstracts VALUES (?, ?)", abstracts)
+        conn.executemany("INSERT OR IGNORE INTO properties VALUES (?, ?, ?, ?)", properties)
+        conn.executemany("INSERT OR IGNORE INTO labels VALUES (?, ?)", labels)
+        conn.commit()
+        abstracts.clear()
+        properties.clear()
+        labels.clear()
+
+    for dump_path in dump_paths:
+        with open_dump(dump_path) as dump:
+            for line in dump:
+                triple = parse_ntriple(line)
+                if triple is None:
+                    skipped += 1
+                    continue
+                s, p, o, lang = triple
+                if p == ABSTRACT:
+                    if lang != "en":
+                        skipped += 1
+                        continue
+                    abstracts.append((s, o))
+                elif p == LABEL:
+                    if lang != "en":
+                        skipped += 1
+                        continue
+                    labels.append((s, o))
+                elif p.startswith(PROPERTY_PREFIXES) and p not in IGNORED and lang in (None, "", "en"):
+                    seq += 1
+                    properties.append((s, seq, p, o))
+                else:
+                    skipped += 1
+                    continue
+                kept += 1
+                if len(abstracts) + len(properties) + len(labels) >= batch_size:
+                    flush()
+        print(f"[INFO] Ingested {dump_path}: {kept} triples kept, {skipped} skipped "
+              f"({time.time() - started:.0f}s)")
+
+    flush()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+class TripleStore:
+    """Read-only access to an ingested store. Lookups are primary-key range scans."""
+
+    def __init__(self, db_path: str = STORE_PATH):
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+
+    def triples(self, entity_uris):
+        """Return (s, p, o) rows for the entities: the abstract first, then properties in dump order."""
+        rows = []
+        for uri in entity_uris:
+            abstract = self.conn.execute(
+                "SELECT abstract FROM abstracts WHERE subject = ?", (uri,)
+            ).fetchone()
+            if abstract:
+                rows.append((uri, ABSTRACT, abstract[0]))
+            rows.extend(
+                (uri, p, o)
+                for p, o in self.conn.execute(
+                    "SELECT predicate, object FROM properties WHERE subject = ? ORDER BY seq LIMIT ?",
+                    (uri, ROWS_PER_ENTITY),
+                )
+            )
+        return rows
+
+    def labels(self, uris) -> dict:
+        """English labels of the URIs that have one; stores ingested without labels have none."""
+        labels = {}
+        try:
+            for uri in uris:
+                row = self.conn.execute("SELECT label FROM labels WHERE subject = ?", (uri,)).fetchone()
+                if row:
+                    labels[uri] = row[0]
+        except sqlite3.OperationalError:
+            pass  # no labels table: built before labels were ingested
+        return labels
+
+
+_store = None
+
+
+def get_store() -> TripleStore:
+    global _store
+    if _store is None:
+        _store = TripleStore(STORE_PATH)
+    return _store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load DBpedia N-Triples dumps into the local store.")
+    parser.add_argument("dumps", nargs="+", help="N-Triples files (.nt, .ttl, optionally .bz2/.gz), e.g. "
+                                                 "abstracts, mappingbased objects/literals and labels")
+    parser.add_argument("--db", default=STORE_PATH, help="SQLite store to create or extend")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    args = parser.parse_args()
+    ingest(args.db, args.dumps, args.batch_size)
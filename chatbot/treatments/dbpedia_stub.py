@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+from collections import defaultdict
+from urllib.parse import urlsplit, parse_qs
+from xml.sax.saxutils import escape
+
+from dbpedia_store import parse_ntriple, open_dump
+from dbpedia_lookup import ABSTRACT, IGNORED_PROPERTIES
+from stub_http import StubHTTPServer, parse_latency
+
+# --- Local stand-in for DBpedia Lookup (KeywordSearch XML) and SPARQL (JSON results) ---
+# Serves the fixture corpus with injectable latency, errors and timeouts, e.g.
+#   python dbpedia_stub.py --port 8890 --sparql-latency lognormal:150,0.6 --error-rate 0.02
+# and point the treatments at it with
+#   DBPEDIA_LOOKUP_BASE=http://127.0.0.1:8890 DBPEDIA_SPARQL_BASE=http://127.0.0.1:8890
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "dbpedia.nt")
+LOOKUP_PATH = "/api/search/KeywordSearch"
+SPARQL_PATH = "/sparql"
+LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+PROPERTY_PREFIXES = ("http://dbpedia.org/ontology/", "http://dbpedia.org/resource/")
+
+IRI_RE = re.compile(r"<([^>]+)>")
+VALUES_RE = re.compile(r"VALUES\s+\?s\s*\{([^}]*)\}")
+SUBJECT_RE = re.compile(r"<([^>]+)>\s+(?:dbo:abstract|\?p)")
+LIMIT_RE = re.compile(r"LIMIT\s+(\d+)", re.IGNORECASE)
+WORD_RE = re.compile(r"\w+")
+
+
+class FixtureCorpus:
+    """Triples of an N-Triples file in memory, queried the way the treatments query DBpedia."""
+
+    def __init__(self, path: str = FIXTURE_PATH):
+        self.triples = defaultdict(list)  # subject -> [(p, o, lang)]
+        self.labels = {}  # subject -> English label
+        self.words = defaultdict(set)  # subject -> words of its labels in any language, for search
+        with open_dump(path) as f:
+            for line in f:
+                triple = parse_ntriple(line)
+                if triple is None:
+                    continue
+                s, p, o, lang = triple
+                self.triples[s].append((p, o, lang))
+                if p == LABEL:
+                    self.words[s].update(WORD_RE.findall(o.lower()))
+                    if lang == "en":
+                        self.labels[s] = o
+
+    def abstract(self, uri: str) -> str:
+        return next((o for p, o, lang in self.triples[uri] if p == ABSTRACT and lang == "en"), "")
+
+    def search(self, query: str, max_hits: int):
+        """Entities whose labels share words with the query, best match and most triples first."""
+        terms = set(WORD_RE.findall(query.lower()))
+        scored = []
+        for uri in self.labels:
+            if not self.abstract(uri):
+                continue  # label-only resources are not Lookup hits
+            words = self.words[uri]
+            matched = len(terms & words)
+            if matched:
+                scored.append((-matched / len(words), -len(self.triples[uri]), uri))
+        return [uri for *_, uri in sorted(scored)[:max_hits]]
+
+    def lookup_xml(self, query: str, max_hits: int) -> str:
+        results = []
+        for uri in self.search(query, max_hits):
+            description = self.abstract(uri).split(". ")[0]
+            results.append(
+                "<Result>"
+                f"<Label>{escape(self.labels[uri])}</Label>"
+                f"<URI>{escape(uri)}</URI>"
+                f"<Description>{escape(description)}</Description>"
+                f"<Refcount>{len(self.triples[uri])}</Refcount>"
+                "</Result>"
+            )
+        return '<?xml version="1.0" encoding="utf-8"?><ArrayOfResults>' + "".join(results) + "</ArrayOfResults>"
+
+    @staticmethod
+    def _term(value: str, lang):
+        if lang is None:
+            return {"type": "uri", "value": value}
+        term = {"type": "literal", "value": value}
+        if lang:
+            term["xml:lang"] = lang
+        return term
+
+    def _properties(self, uri: str, batched: bool):
+        for p, o, lang in self.triples[uri]:
+            if not p.startswith(PROPERTY_PREFIXES):
+                continue
+            if batched and (p in IGNORED_PROPERTIES or lang not in (None, "", "en")):
+                continue
+            yield p, o, lang
+
+    def sparql(self, query: str) -> dict:
+        """Answer the query shapes of dbpedia_lookup (batched, per entity, labels)."""
+        limit = int(m.group(1)) if (m := LIMIT_RE.search(query)) else None
+        values = VALUES_RE.search(query)
+        subjects = IRI_RE.findall(values.group(1)) if values else SUBJECT_RE.findall(query)[:1]
+
+        if "?label" in query:
+            variables = ["s", "label"]
+            rows = [
+                {"s": self._term(s, None), "label": self._term(self.labels[s], "en")}
+                for s in subjects if s in self.labels
+            ]
+        elif "SELECT ?abstract" in query:
+            variables = ["abstract"]
+            rows = [{"abstract": self._term(a, "en")} for s in subjects if (a := self.abstract(s))]
+        elif "SELECT ?p ?o" in query:
+            variables = ["p", "o"]
+            rows = [
+                {"p": self._term(p, None), "o": self._term(o, lang)}
+                for s in subjects for p, o, lang in self._properties(s, batched=False)
+            ]
+        else:
+            variables = ["s", "p", "o"]
+            rows = []
+            for s in subjects:
+                if abstract := self.abstract(s):
+                    rows.append({"s": self._term(s, None), "p": self._term(ABSTRACT, None), "o": self._term(abstract, "en")})
+                rows += [
+                    {"s": self._term(s, None), "p": self._term(p, None), "o": self._term(o, lang)}
+                    for p, o, lang in self._properties(s, batched=True)
+                ]
+        if limit is not None:
+            rows = rows[:limit]
+        return {"head": {"vars": variables}, "results": {"bindings": rows}}
+
+
+class StubServer(StubHTTPServer):
+    """
+    Each request waits for a latency drawn from its endpoint's distribution, then fails
+    with 503 (error_rate), hangs without answering (timeout_rate, until the client gives
+    up) or answers from the corpus.
+    """
+
+    def __init__(self, corpus: FixtureCorpus = None, lookup_latency: str = "none", sparql_latency: str = "none",
+                 error_rate: float = 0.0, timeout_rate: float = 0.0, hang: float = 60.0, seed: int = None):
+        super().__init__()
+        self.corpus = corpus or FixtureCorpus()
+        self.latency = {LOOKUP_PATH: parse_latency(lookup_latency), SPARQL_PATH: parse_latency(sparql_latency)}
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.rng = random.Random(seed)
+
+    async def respond(self, method: str, target: str, headers: dict, body: bytes):
+        url = urlsplit(target)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == "/stats":
+            return "200 OK", {"Content-Type": "application/json"}, json.dumps(self.counts).encode()
+        if method != "GET" or url.path not in self.latency:
+            return "404 Not Found", {"Content-Type": "text/plain"}, b"not found"
+
+        self.counts[url.path] += 1
+        await asyncio.sleep(self.latency[url.path](self.rng))
+        roll = self.rng.random()
+        if roll < self.timeout_rate:
+            self.counts["timeouts"] += 1
+            await asyncio.sleep(self.hang)
+            return None
+        if roll < self.timeout_rate + self.error_rate:
+            self.counts["errors"] += 1
+            return "503 Service Unavailable", {"Content-Type": "text/plain"}, b"injected error"
+
+        if url.path == LOOKUP_PATH:
+            xml = self.corpus.lookup_xml(params.get("QueryString", ""), int(params.get("MaxHits", 5)))
+            return "200 OK", {"Content-Type": "application/xml"}, xml.encode("utf-8")
+        result = self.corpus.sparql(params.get("query", ""))
+        return "200 OK", {"Content-Type": "application/sparql-results+json"}, json.dumps(result).encode("utf-8")
+
+
+async def _serve(args):
+    stub = StubServer(
+        FixtureCorpus(args.fixtures),
+        lookup_latency=args.lookup_latency,
+        sparql_latency=args.sparql_latency,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        hang=args.hang,
+        seed=args.seed,
+    )
+    await stub.start(args.host, args.port)
+    print(f"DBpedia stand-in on {stub.base_url} ({len(stub.corpus.labels)} labelled resources)")
+    await stub.server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local DBpedia Lookup/SPARQL stand-in for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8890)
+    parser.add_argument("--fixtures", default=FIXTURE_PATH, help="N-Triples file (.nt, .nt.gz, .nt.bz2)")
+    parser.add_argument("--lookup-latency", default="none", help="none | fixed:MS | uniform:MIN,MAX | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--sparql-latency", default="none")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of requests never answered")
+    parser.add_argument("--hang", type=float, default=60.0, help="seconds an unanswered request is held open")
+    parser.add_argument("--seed", type=int, default=None)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
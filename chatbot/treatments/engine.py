@@ -0,0 +1,422 @@
+import asyncio
+import json
+import os
+import time
+
+from openai import AsyncOpenAI
+from openai_scheduler import get_scheduler, PRIORITY_FOLLOWUP
+from prefetch import LookupPrefetch, SPECULATIVE_PREFETCH
+from dbpedia_client import Deadline, TURN_BUDGET
+from tool_stream import ToolCallAccumulator
+from payload import compact_tool_content
+from history import ConversationHistory
+from session_store import get_session_store
+from stream_buffer import coalesced
+from dbpedia_client import client_stats
+from dbpedia_lookup import cache_stats
+import answer_cache
+import loop_watchdog
+import metrics
+import openai_cassette
+
+# --- One engine for all four treatments, sharing the client, connection pools and caches ---
+
+API_KEY_PATH = os.environ.get(
+    "OPENAI_API_KEY_FILE",
+    "/Users/lara-aidajopp/Documents/Programming_Stuff/Universität Mannheim/Masterthesis/chatbot/api-key-GPT.txt",
+)
+PROMPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "systemprompts")
+
+DBPEDIA_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "dbpedia_lookup",
+        "description": "Look up top 3 matching entities in DBpedia and return dbo:abstract and 5 further properties for each entity.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Search query string (nouns from user query)"},
+                "max_results": {"type": "integer", "description": "Max results to return"}
+            },
+            "required": ["query"]
+        }
+    }
+}
+
+BASE_SETTINGS = {
+    "model": "gpt-4.1-mini-2025-04-14",
+    "temperature": 0,
+    "max_completion_tokens": 525,
+    "response_format": {"type": "text"},
+}
+
+# code: value of TR01 in the survey data (1 = Vanilla, 2 = CoT, 3 = RAG, 4 = CoTxRAG)
+# history: "session" keeps the conversation (token-bounded, in the session store), None answers each message alone
+TREATMENTS = {
+    "vanilla": {"code": 1, "label": "Vanilla", "prompt": "vanilla.txt", "tools": [], "history": "session"},
+    "cot": {"code": 2, "label": "CoT", "prompt": "cot.txt", "tools": [], "history": "session"},
+    "rag": {"code": 3, "label": "RAG", "prompt": "rag.txt", "tools": [DBPEDIA_TOOL], "history": None},
+    "rag_cot": {"code": 4, "label": "CoTxRAG", "prompt": "rag_cot.txt", "tools": [DBPEDIA_TOOL], "history": None},
+}
+DEFAULT_TREATMENT = os.environ.get("TREATMENT", "vanilla")
+
+
+def treatment_by_code(code) -> str:
+    """Map a TR01 code (1-4) or a treatment name to the treatment name, None if unknown."""
+    if code in TREATMENTS:
+        return code
+    for name, treatment in TREATMENTS.items():
+        if str(treatment["code"]) == str(code).strip():
+            return name
+    return None
+
+
+def load_api_key() -> str:
+    if os.environ.get("OPENAI_API_KEY"):
+        return os.environ["OPENAI_API_KEY"]
+    with open(API_KEY_PATH) as f:
+        return f.read().strip()
+
+
+def make_client() -> AsyncOpenAI:
+    """The OpenAI client; with OPENAI_CASSETTE_MODE set, its requests go through the cassette store."""
+    http_client = openai_cassette.http_client()
+    if http_client is None:
+        return AsyncOpenAI(api_key=load_api_key(), max_retries=0)
+    api_key = "replay" if openai_cassette.CASSETTE_MODE == "replay" else load_api_key()
+    return AsyncOpenAI(api_key=api_key, max_retries=0, http_client=http_client)
+
+
+class TreatmentEngine:
+    """
+    Serves every treatment declared in TREATMENTS. run_turn() answers one user message and
+    streams the answer into a sink with the stream_token()/update() methods of cl.Message,
+    so the same code path runs in Chainlit and headless.
+    """
+
+    def __init__(self, treatments: dict = TREATMENTS, client=None):
+        self.treatments = treatments
+        # Retries are handled by the shared scheduler, which knows about the rate limits
+        self.client = client or make_client()
+        self.scheduler = get_scheduler(self.client)
+        self.prompts = {}
+        metrics.register("openai_scheduler", self.scheduler.stats)
+        metrics.register("dbpedia_client", client_stats)
+        metrics.register("dbpedia_cache", cache_stats)
+        metrics.register("answer_cache", answer_cache.answer_cache.stats)
+
+    def system_prompt(self, name: str) -> str:
+        if name not in self.prompts:
+            with open(os.path.join(PROMPT_DIR, self.treatments[name]["prompt"])) as s:
+                self.prompts[name] = s.read()
+        return self.prompts[name]
+
+    def settings(self, name: str) -> dict:
+        return {**BASE_SETTINGS, "tools": self.treatments[name]["tools"], "tool_choice": "auto"}
+
+    def new_history(self, name: str, session_id: str = None):
+        """History for a new session, None for treatments that answer each message alone."""
+        if self.treatments[name]["history"] != "session":
+            return None
+        if session_id is None:
+            return ConversationHistory()
+        return ConversationHistory(store=get_session_store(), session_id=session_id)
+
+    async def run_turn(self, name: str, text: str, msg, history=None, trace: metrics.Trace = None) -> str:
+        """Answer one user message; returns the streamed answer. Pass a trace to read its spans afterwards."""
+        loop_watchdog.ensure_started()
+        msg = coalesced(msg)
+        with metrics.trace_turn(name, trace) as trace:
+            if self.treatments[name]["tools"]:
+                return await self._tool_turn(name, text, msg, trace)
+            return await self._chat_turn(name, text, msg, history, trace)
+
+    async def _chat_turn(self, name, text, msg, history, trace):
+        settings = self.settings(name)
+        system_prompt = self.system_prompt(name)
+        if history is None:
+            history = self.new_history(name)
+        await history.refresh()
+
+        # Add the current user message; the oldest turns are dropped once the token budget is reached
+        await history.record("user", text)
+
+        # Ensure that the system prompt comes first, to ensure that the history is considered always
+        messages = history.prompt(system_prompt)
+
+        # Identical conversations at temperature 0 get the stored answer without an API call
+        cache_key = None
+        cached = None
+        if answer_cache.cacheable(settings):
+            cache_key = answer_cache.cache_key(name, settings, system_prompt, messages)
+            cached = await answer_cache.get(cache_key)
+
+        if cached is not None:
+            trace.attrs["cached"] = True
+            assistant_reply = cached["content"]
+            await answer_cache.replay(msg, assistant_reply)
+        else:
+            # Send the conversation history to the model's API
+            requested = time.monotonic()
+            stream = await self.scheduler.create(
+                messages=messages,
+                stream=True,
+                **settings
+            )
+
+            # Collect the assistant's reply
+            assistant_reply = ""
+            finish_reason = None
+            async for chunk in stream:
+                if token := chunk.choices[0].delta.content:
+                    if not assistant_reply:
+                        trace.mark("llm_ttft", requested)
+                    assistant_reply += token
+                    await msg.stream_token(token)
+                if chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                    await msg.flush()
+
+            # only complete answers are stored
+            if cache_key and finish_reason == "stop":
+                answer_cache.put(cache_key, {"content": assistant_reply})
+
+        await msg.update()
+
+        # Add the assistants reply to history
+        await history.record("assistant", assistant_reply)
+        return assistant_reply
+
+    async def _tool_turn(self, name, text, msg, trace):
+        settings = self.settings(name)
+        system_prompt = self.system_prompt(name)
+
+        # Retrieval gets the turn budget from the moment the first call is answered (cache or
+        # stream), so time queued in the scheduler for a rate-limit slot does not count against it
+        prefetch = LookupPrefetch()
+
+        init_messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text},
+        ]
+
+        # At temperature 0 the first call's answer or tool calls can be replayed from the cache
+        cache_key = None
+        cached = None
+        if answer_cache.cacheable(settings):
+            cache_key = answer_cache.cache_key(name, settings, system_prompt, init_messages)
+            cached = await answer_cache.get(cache_key)
+
+        # Start the lookup as soon as the streamed 'query' argument is complete
+        def on_tool_field(slot, key, value):
+            if slot["name"] == "dbpedia_lookup" and key == "query" and value:
+                max_results = slot["fields"].get("max_results", 3)
+                prefetch.start_query(value, max_results if isinstance(max_results, int) else 3)
+
+        # Accumulate streamed tool calls by their CHOICE INDEX (stable across deltas)
+        pending_tool_calls = ToolCallAccumulator(on_tool_field)
+        assistant_text = ""
+
+        if cached is not None:
+            trace.attrs["cached"] = True
+            prefetch.deadline = Deadline(TURN_BUDGET)
+            assistant_text = cached["content"]
+            await answer_cache.replay(msg, assistant_text)
+            pending_tool_calls.restore(cached["tool_calls"])
+        else:
+            requested = time.monotonic()
+            first = True
+            stream = await self.scheduler.create(
+                messages=init_messages,
+                stream=True,
+                **settings
+            )
+            prefetch.deadline = Deadline(TURN_BUDGET)
+            # Optionally start a lookup on the nouns of the message while the model decides on its tool call
+            if SPECULATIVE_PREFETCH:
+                prefetch.start(text)
+
+            finish_reason = None
+            async for chunk in stream:
+                choice = chunk.choices[0]
+                delta = choice.delta
+                if first and (delta.content or delta.tool_calls):
+                    trace.mark("llm_ttft", requested)
+                    first = False
+
+                # stream any plain text tokens the model emits before tools
+                if delta.content:
+                    assistant_text += delta.content
+                    await msg.stream_token(delta.content)
+
+                # accumulate tool calls by 'index'; append argument chunks
+                if delta.tool_calls:
+                    pending_tool_calls.add(delta.tool_calls)
+
+                if choice.finish_reason:
+                    # show any text before the tool call while the lookup runs
+                    finish_reason = choice.finish_reason
+                    if finish_reason == "tool_calls":
+                        trace.mark("tool_args", requested)
+                    await msg.flush()
+
+            if cache_key and finish_reason in ("stop", "tool_calls"):
+                answer_cache.put(cache_key, {"content": assistant_text, "tool_calls": pending_tool_calls.to_cache()})
+
+        # If the model answered directly - it ends here
+        if not pending_tool_calls:
+            prefetch.cancel()
+            await msg.update()
+            return assistant_text
+
+        # Parse the arguments of every requested tool call
+        calls = []
+        for idx, slot in pending_tool_calls.items():
+            try:
+                args = json.loads(slot["arguments"] or "{}")
+            except json.JSONDecodeError:
+                args = {}
+
+            # if model didn't pass 'query', fall back to user's message
+            calls.append({
+                "id": slot["id"] or f"tool_{idx}",  # FIX (2): ensure a string id
+                "name": slot["name"] or "dbpedia_lookup",
+                "query": args.get("query") or text,
+                "max_results": int(args.get("max_results", 3)),
+            })
+
+        # Run all lookups concurrently
+        with metrics.span("retrieval_wait", calls=len(calls)):
+            results = await asyncio.gather(
+                *(prefetch.result_for(call["query"], call["max_results"]) for call in calls)
+            )
+        prefetch.cancel()
+
+        # Decide success vs fallback per call
+        trace.details["tool_calls"] = []
+        found = [
+            bool(result) and ("error" not in result.lower()) and ("No DBpedia result" not in result)
+            for result in results
+        ]
+
+        if any(found):
+            # Build one tool result message per call the model can read
+            tool_messages = []
+            for call, result, ok in zip(calls, results, found):
+                if ok:
+                    try:
+                        dbp_json = json.loads(result)
+                    except Exception:
+                        dbp_json = {"raw": result}
+                else:
+                    dbp_json = {"error": "No DBpedia result"}
+                tool_content, tokens = compact_tool_content(dbp_json)
+                print(f"[DEBUG] Tool payload for '{call['query']}': {tokens} tokens")
+                trace.details["tool_calls"].append({"query": call["query"], "content": tool_content, "tokens": tokens})
+                tool_messages.append({
+                    "role": "tool",
+                    "tool_call_id": call["id"],
+                    "content": tool_content,
+                })
+
+            followup_messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": text},
+                {
+                    "role": "assistant",
+                    "content": "",
+                    "tool_calls": [
+                        {
+                            "id": call["id"],
+                            "type": "function",
+                            "function": {
+                                "name": call["name"],
+                                "arguments": json.dumps({"query": call["query"], "max_results": call["max_results"]})
+                            }
+                        }
+                        for call in calls
+                    ]
+                },
+                *tool_messages,
+            ]
+
+            followup_cfg = {**settings}  # keep tools enabled for this path
+
+        else:
+            # fallback — disable tools so it won't try to call again
+            trace.attrs["fallback"] = True
+            followup_messages = [
+                {"role": "system",
+                 "content": system_prompt + "\n(Note: No DBpedia entity found. Answer yourself without tools. Mark it with AI-generated.)"},
+                {"role": "user", "content": text}
+            ]
+            followup_cfg = {**settings, "tools": [], "tool_choice": "none"}
+
+        # The follow-up is keyed on the tool payloads as well
+        followup_key = None
+        if answer_cache.cacheable(followup_cfg):
+            tool_payload = "\n".join(m["content"] for m in followup_messages if m["role"] == "tool")
+            followup_key = answer_cache.cache_key(
+                name, followup_cfg, followup_messages[0]["content"], followup_messages, tool_payload
+            )
+            cached = await answer_cache.get(followup_key)
+            if cached is not None:
+                trace.attrs["cached"] = True
+                await answer_cache.replay(msg, cached["content"])
+                await msg.update()
+                return assistant_text + cached["content"]
+
+        # Second pass: stream the final answer token by token
+        requested = time.monotonic()
+        followup_stream = await self.scheduler.create(
+            priority=PRIORITY_FOLLOWUP,
+            messages=followup_messages,
+            stream=True,
+            **followup_cfg
+        )
+        final_text = ""
+        finish_reason = None
+        async for chunk in followup_stream:
+            if not chunk.choices:
+                continue
+            if token := chunk.choices[0].delta.content:
+                if not final_text:
+                    trace.mark("followup_ttft", requested)
+                final_text += token
+                await msg.stream_token(token)
+            if chunk.choices[0].finish_reason:
+                finish_reason = chunk.choices[0].finish_reason
+                await msg.flush()
+
+        if followup_key and finish_reason == "stop":
+            answer_cache.put(followup_key, {"content": final_text})
+
+        await msg.update()
+        return assistant_text + final_text
+
+
+_engine = None
+
+
+def get_engine() -> TreatmentEngine:
+    """One engine per process, created on first use."""
+    global _engine
+    if _engine is None:
+        _engine = TreatmentEngine()
+    return _engine
+
+
+async def respond(name: str, message):
+    """Chainlit handler body: answer message with treatment name in the current session."""
+    import chainlit as cl  # only the UI needs chainlit; headless runs use run_turn directly
+
+    engine = get_engine()
+    # Load existing or start new history; the session store makes it available to every worker
+    history = cl.user_session.get("history")
+    if history is None:
+        history = engine.new_history(name, cl.context.session.thread_id)
+        cl.user_session.set("history", history)
+
+    # Chainlit message without history
+    msg = await cl.Message(content="").send()
+    await engine.run_turn(name, message.content, msg, history=history)
@@ -0,0 +1,78 @@
+import os
+from collections import deque
+
+from payload import count_tokens
+
+# --- Token-bounded conversation history for the treatments that keep one ---
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", 4000))
+MESSAGE_OVERHEAD = 4  # role and separators the API adds per message
+RESTORE_LIMIT = 200  # messages read back from the store; older ones fall out of the budget anyway
+
+
+class ConversationHistory:
+    """
+    User/assistant messages with their token counts, counted once when appended.
+    Once the history exceeds the budget, the oldest turns are dropped, so the prompt
+    (system prompt + history) stays flat however long the session runs. The current
+    turn - the user message and, once recorded, its answer - is always kept, and the
+    history never starts with an answer whose question is gone.
+    With a session store, every recorded message is also appended to the store, so any
+    worker can pick up the conversation.
+    """
+
+    def __init__(self, budget: int = HISTORY_TOKEN_BUDGET, store=None, session_id: str = None):
+        self.budget = budget
+        self.store = store
+        self.session_id = session_id
+        self.messages = deque()  # (message dict, tokens)
+        self.tokens = 0
+        self.dropped = 0
+        self.persisted = 0  # messages of this session in the store, as far as we know
+
+    def append(self, role: str, content: str):
+        tokens = count_tokens(content) + MESSAGE_OVERHEAD
+        self.messages.append(({"role": role, "content": content}, tokens))
+        self.tokens += tokens
+        self._trim()
+
+    async def record(self, role: str, content: str):
+        """append() and write the message through to the store."""
+        self.append(role, content)
+        if self.store is not None:
+            await self.store.append(self.session_id, role, content)
+            self.persisted += 1
+
+    async def refresh(self):
+        """Reload from the store if another worker has added messages to this session."""
+        if self.store is None:
+            return
+        count = await self.store.count(self.session_id)
+        if count == self.persisted:
+            return
+        self.messages.clear()
+        self.tokens = 0
+        for role, content in await self.store.tail(self.session_id, RESTORE_LIMIT):
+            self.append(role, content)
+        self.persisted = count
+
+    def _trim(self):
+        keep = 1
+        if len(self.messages) >= 2 and self.messages[-1][0]["role"] == "assistant" \
+                and self.messages[-2][0]["role"] == "user":
+            keep = 2  # an answer stays with its question, even if the pair alone is over budget
+        while len(self.messages) > keep and (
+            self.tokens > self.budget or self.messages[0][0]["role"] == "assistant"
+        ):
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        _message, tokens = self.messages.popleft()
+        self.tokens -= tokens
+        self.dropped += 1
+
+    def prompt(self, system_prompt: str):
+        """System prompt first, to ensure that the history is considered always."""
+        return [{"role": "system", "content": system_prompt}] + [m for m, _ in self.messages]
+
+    def __len__(self):
+        return len(self.messages)
@@ -0,0 +1,431 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from stub_http import parse_latency
+
+# --- Concurrent-session load generator for the treatments ---
+# Simulated participants replay question scripts with think time between their messages and
+# the time to first token and to the full answer is measured per turn, as the participant sees it.
+#   python loadgen.py --sessions 50 --treatments vanilla rag_cot
+# runs the engine in this process against local OpenAI and DBpedia stand-ins (stub latencies
+# via --openai-ttft, --sparql-latency, ...), or against stand-ins already running elsewhere with
+# --openai-base/--dbpedia-base. The DBpedia lookup/entity/label caches are off unless
+# --warm-cache is given, so every RAG turn pays the stand-in's latency (identical requests in
+# flight at the same time are still shared); with it, the sessions share the in-memory caches
+# like the sessions of one worker do. With --url the sessions are Chainlit websocket sessions
+# against a running app (chainlit run app.py, or rag_cot.py/vanilla.py), which needs python-socketio.
+# In-process runs watch the event loop (LOOP_WATCHDOG, unless set to 0) and exit with 1 when
+# anything blocked it for longer than LOOP_STALL_MS.
+SCRIPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "question_scripts.json")
+THINK_TIME = "lognormal:20000,0.5"  # reading the answer and typing the next question
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StandIns:
+    """OpenAI and DBpedia stand-ins on their own event loop thread, off the loop under test."""
+
+    def __init__(self, args):
+        self.args = args
+        self.loop = asyncio.new_event_loop()
+        self.ports = {"openai": free_port(), "dbpedia": free_port()}
+        self.stubs = {}
+
+    @property
+    def environ(self) -> dict:
+        return {
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{self.ports['openai']}/v1",
+            "DBPEDIA_LOOKUP_BASE": f"http://127.0.0.1:{self.ports['dbpedia']}",
+            "DBPEDIA_SPARQL_BASE": f"http://127.0.0.1:{self.ports['dbpedia']}",
+        }
+
+    def start(self):
+        ready = threading.Event()
+        threading.Thread(target=self._run, args=(ready,), name="stand-ins", daemon=True).start()
+        ready.wait()
+        return self
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._start())
+        ready.set()
+        self.loop.run_forever()
+
+    async def _start(self):
+        # imported here: dbpedia_stub pulls in dbpedia_client, which reads its base URLs at import
+        from dbpedia_stub import StubServer
+        from openai_stub import OpenAIStub
+
+        args = self.args
+        self.stubs["openai"] = await OpenAIStub(
+            ttft=args.openai_ttft, inter_token=args.openai_inter_token, answer_tokens=args.answer_tokens,
+            rpm=args.openai_rpm, rate_limit_rate=args.openai_rate_limit_rate, seed=args.seed,
+        ).start(port=self.ports["openai"])
+        self.stubs["dbpedia"] = await StubServer(
+            lookup_latency=args.lookup_latency, sparql_latency=args.sparql_latency,
+            error_rate=args.dbpedia_error_rate, seed=args.seed,
+        ).start(port=self.ports["dbpedia"])
+
+    def stats(self) -> dict:
+        return {name: dict(stub.counts) for name, stub in self.stubs.items()}
+
+    def stop(self):
+        async def close():
+            for stub in self.stubs.values():
+                await stub.close()
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class TimingSink:
+    """Stands in for cl.Message: notes when the first token reaches the participant."""
+
+    def __init__(self):
+        self.first_token = None
+        self.emits = 0
+
+    async def stream_token(self, token: str):
+        if self.first_token is None:
+            self.first_token = time.monotonic()
+        self.emits += 1
+
+    async def update(self):
+        pass
+
+
+class EngineClient:
+    """Sessions in this process, through TreatmentEngine.run_turn like the Chainlit handler."""
+
+    def __init__(self):
+        from engine import get_engine  # after the environment points at the stand-ins
+
+        self.engine = get_engine()
+
+    async def open(self, treatment: str):
+        return {"treatment": treatment, "history": self.engine.new_history(treatment, f"loadgen-{uuid.uuid4()}")}
+
+    async def turn(self, session, text: str):
+        import metrics
+
+        sink = TimingSink()
+        trace = metrics.Trace(session["treatment"])
+        started = time.monotonic()
+        await self.engine.run_turn(session["treatment"], text, sink, history=session["history"], trace=trace)
+        return sink.first_token, time.monotonic(), started, bool(trace.attrs.get("fallback"))
+
+    async def close(self, session):
+        pass
+
+    def server_stats(self) -> dict:
+        import metrics
+
+        return metrics.snapshot()
+
+
+class WebsocketClient:
+    """
+    Sessions as the browser opens them: socket.io on /ws/socket.io, the treatment assigned
+    by the "tr" parameter of the referer (see app.py), one client_message per turn. The
+    answer starts with the first stream_token and is complete at task_end.
+    """
+
+    def __init__(self, url: str, timeout: float):
+        try:
+            import socketio
+        except ImportError:
+            sys.exit("Websocket mode needs python-socketio: pip install 'python-socketio[asyncio_client]'")
+        self.socketio = socketio
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    async def open(self, treatment: str):
+        from engine import TREATMENTS
+
+        sio = self.socketio.AsyncClient(reconnection=False)
+        session = {"treatment": treatment, "sio": sio, "thread_id": str(uuid.uuid4()), "first": None, "done": None}
+
+        @sio.on("stream_token")
+        async def on_token(data):
+            if session["first"] is not None and not session["first"].done():
+                session["first"].set_result(time.monotonic())
+
+        @sio.on("task_end")
+        async def on_task_end(*_):
+            if session["done"] is not None and not session["done"].done():
+                session["done"].set_result(time.monotonic())
+
+        code = TREATMENTS[treatment]["code"]
+        await sio.connect(
+            self.url,
+            socketio_path="/ws/socket.io",
+            transports=["websocket"],
+            headers={"Referer": f"{self.url}/?tr={code}"},
+            auth={
+                "clientType": "webapp",
+                "sessionId": str(uuid.uuid4()),
+                "threadId": session["thread_id"],
+                "userEnv": "{}",
+                "chatProfile": TREATMENTS[treatment]["label"],
+            },
+        )
+        await sio.emit("connection_successful")
+        await asyncio.sleep(0.2)  # on_chat_start runs before the first message
+        return session
+
+    async def turn(self, session, text: str):
+        loop = asyncio.get_running_loop()
+        session["first"], session["done"] = loop.create_future(), loop.create_future()
+        started = time.monotonic()
+        await session["sio"].emit("client_message", {
+            "message": {
+                "id": str(uuid.uuid4()),
+                "threadId": session["thread_id"],
+                "name": "User",
+                "type": "user_message",
+                "output": text,
+                "createdAt": datetime.now(timezone.utc).isoformat(),
+            },
+            "fileReferences": [],
+        })
+        finished = await asyncio.wait_for(session["done"], self.timeout)
+        first = session["first"].result() if session["first"].done() else None
+        return first, finished, started, None  # the app does not report retrieval fallbacks
+
+    async def close(self, session):
+        await session["sio"].disconnect()
+
+    def server_stats(self) -> dict:
+        return {}  # scrape the app's METRICS_PORT for its side
+
+
+async def run_session(index: int, client, treatment: str, script, think, rng, args, results):
+    await asyncio.sleep(args.ramp * index / max(1, args.sessions))
+    try:
+        session = await client.open(treatment)
+    except Exception as e:
+        results.append({"treatment": treatment, "session": index, "turn": -1, "error": f"{type(e).__name__}: {e}"})
+        return
+    try:
+        for repeat in range(args.repeat):
+            for turn, text in enumerate(script):
+                if turn or repeat:
+                    await asyncio.sleep(think(rng) * args.think_scale)
+                result = {"treatment": treatment, "session": index, "turn": turn}
+                try:
+                    first, finished, started, fallback = await client.turn(session, text)
+                    result.update(
+                        started=started,
+                        finished=finished,
+                        ttft=first - started if first is not None else None,
+                        full=finished - started,
+                        fallback=fallback,
+                    )
+                except Exception as e:
+                    result.update(error=f"{type(e).__name__}: {e}")
+                results.append(result)
+    finally:
+        await client.close(session)
+
+
+def summarize(results) -> dict:
+    by_treatment = defaultdict(list)
+    for result in results:
+        by_treatment[result["treatment"]].append(result)
+    report = {}
+    for treatment, rows in sorted(by_treatment.items()):
+        done = [r for r in rows if "error" not in r]
+        ttft = [r["ttft"] for r in done if r["ttft"] is not None]
+        full = [r["full"] for r in done]
+        elapsed = max((r["finished"] for r in done), default=0) - min((r["started"] for r in done), default=0)
+        report[treatment] = {
+            "sessions": len({r["session"] for r in rows}),
+            "turns": len(done),
+            "errors": len(rows) - len(done),
+            "fallbacks": sum(1 for r in done if r["fallback"]),  # RAG turns answered without a DBpedia result
+            "turns_per_s": len(done) / elapsed if elapsed > 0 else 0.0,
+            "ttft": {f"p{round(q * 100)}": percentile(ttft, q) for q in QUANTILES},
+            "full": {f"p{round(q * 100)}": percentile(full, q) for q in QUANTILES},
+        }
+        errors = defaultdict(int)
+        for r in rows:
+            if "error" in r:
+                errors[r["error"].split(":")[0]] += 1
+        if errors:
+            report[treatment]["error_types"] = dict(errors)
+    return report
+
+
+def print_report(report: dict, elapsed: float):
+    print(f"\n{'treatment':<10}{'sess':>6}{'turns':>7}{'err':>5}{'turn/s':>8}"
+          f"{'ttft p50':>10}{'p95':>8}{'p99':>8}{'full p50':>10}{'p95':>8}{'p99':>8}")
+    for treatment, row in report.items():
+        ttft, full = row["ttft"], row["full"]
+        print(
+            f"{treatment:<10}{row['sessions']:>6}{row['turns']:>7}{row['errors']:>5}{row['turns_per_s']:>8.2f}"
+            f"{ttft['p50']:>9.3f}s{ttft['p95']:>7.3f}s{ttft['p99']:>7.3f}s"
+            f"{full['p50']:>9.3f}s{full['p95']:>7.3f}s{full['p99']:>7.3f}s"
+        )
+        if row.get("error_types"):
+            print(f"{'':<10}errors: {row['error_types']}")
+        if row["fallbacks"]:
+            print(f"{'':<10}fallbacks: {row['fallbacks']} turns answered without a DBpedia result")
+    print(f"wall time {elapsed:.1f}s")
+
+
+async def run(args, client) -> list:
+    with open(args.scripts, encoding="utf-8") as f:
+        scripts = json.load(f)
+    unknown = [name for name in args.script if name not in scripts]
+    if unknown:
+        sys.exit(f"Unknown script(s) {unknown}, available: {', '.join(scripts)}")
+    rng = random.Random(args.seed)
+    think = parse_latency(args.think)
+    results = []
+    await asyncio.gather(*(
+        run_session(i, client, args.treatments[i % len(args.treatments)], scripts[rng.choice(args.script)],
+                    think, random.Random(rng.random()), args, results)
+        for i in range(args.sessions)
+    ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load generator for the treatments")
+    parser.add_argument("--sessions", type=int, default=20, help="simultaneous participants")
+    parser.add_argument("--treatments", nargs="+", default=["vanilla", "rag_cot"], help="assigned round-robin")
+    parser.add_argument("--scripts", default=SCRIPTS_PATH, help="JSON file: script name -> list of messages")
+    parser.add_argument("--script", nargs="+", default=["experiment"], help="scripts drawn per session")
+    parser.add_argument("--repeat", type=int, default=1, help="times each session runs through its script")
+    parser.add_argument("--think", default=THINK_TIME, help="think time between messages, as for the stubs (ms)")
+    parser.add_argument("--think-scale", type=float, default=1.0, help="e.g. 0.05 for a compressed run")
+    parser.add_argument("--ramp", type=float, default=10.0, help="seconds over which the sessions start")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--url", help="running Chainlit app, e.g. http://127.0.0.1:8000 (websocket mode)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for an answer (websocket mode)")
+    parser.add_argument("--openai-base", help="OpenAI stand-in already running, e.g. http://127.0.0.1:8891/v1")
+    parser.add_argument("--dbpedia-base", help="DBpedia stand-in already running, e.g. http://127.0.0.1:8890")
+    parser.add_argument("--openai-ttft", default="lognormal:350,0.4")
+    parser.add_argument("--openai-inter-token", default="fixed:12")
+    parser.add_argument("--openai-rpm", type=int, default=0)
+    parser.add_argument("--openai-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--lookup-latency", default="lognormal:120,0.5")
+    parser.add_argument("--sparql-latency", default="lognormal:150,0.6")
+    parser.add_argument("--dbpedia-error-rate", type=float, default=0.0)
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="share the DBpedia caches across sessions (default: off, every turn queries DBpedia)")
+    args = parser.parse_args()
+    unknown = [t for t in args.treatments if t not in ("vanilla", "cot", "rag", "rag_cot")]
+    if unknown:
+        sys.exit(f"Unknown treatment(s): {unknown}")
+
+    if args.url:
+        retrieval_cache = "as configured in the app"
+    elif args.warm_cache:
+        retrieval_cache = "warm (in-memory DBpedia caches shared by all sessions)"
+    else:
+        retrieval_cache = "off (every RAG turn queries DBpedia; concurrent identical requests are shared)"
+
+    stand_ins = None
+    if args.url:
+        client_factory = lambda: WebsocketClient(args.url, args.timeout)
+    else:
+        # every answer comes from the stand-ins: no answer cache, trace log or cache files
+        os.environ.update({
+            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "stub"),
+            "ANSWER_CACHE": "0",
+            "TRACE_LOG": "",
+            "LOOP_WATCHDOG": os.environ.get("LOOP_WATCHDOG", "1"),
+            "DBPEDIA_CACHE": "1" if args.warm_cache else "0",
+            "DBPEDIA_CACHE_PATH": "",
+            "SESSION_STORE": "sqlite",
+            "SESSION_STORE_PATH": os.path.join(tempfile.mkdtemp(prefix="loadgen-"), "sessions.sqlite3"),
+        })
+        if args.openai_base and args.dbpedia_base:
+            os.environ.update({
+                "OPENAI_BASE_URL": args.openai_base,
+                "DBPEDIA_LOOKUP_BASE": args.dbpedia_base,
+                "DBPEDIA_SPARQL_BASE": args.dbpedia_base,
+            })
+        else:
+            stand_ins = StandIns(args)
+            os.environ.update(stand_ins.environ)
+            stand_ins.start()
+        client_factory = EngineClient
+
+    async def go():
+        client = client_factory()
+        started = time.monotonic()
+        results = await run(args, client)
+        elapsed, server = time.monotonic() - started, client.server_stats()
+        stalled = None
+        if not args.url:
+            import loop_watchdog
+
+            try:
+                loop_watchdog.check()
+            except loop_watchdog.LoopStalled as e:
+                stalled = e
+        return results, elapsed, server, stalled
+
+    try:
+        results, elapsed, server, stalled = asyncio.run(go())
+    finally:
+        if stand_ins is not None:
+            stand_ins.stop()
+
+    report = summarize(results)
+    if args.json:
+        print(json.dumps({
+            "treatments": report,
+            "wall_time_s": elapsed,
+            "retrieval_cache": retrieval_cache,
+            "server": server,
+            "stand_ins": stand_ins.stats() if stand_ins else {},
+            "loop_stalled": str(stalled) if stalled else None,
+        }, indent=2, default=str))
+        return 1 if stalled else 0
+    print_report(report, elapsed)
+    print(f"retrieval caches: {retrieval_cache}")
+    for stage in ("llm_ttft", "retrieval_wait", "followup_ttft"):
+        for treatment, snapshot in server.get("latency_seconds", {}).get(stage, {}).items():
+            print(f"server {stage:<15}{treatment:<10}p50 {snapshot['p50']:.3f}s  p95 {snapshot['p95']:.3f}s  n={snapshot['count']}")
+    if scheduler := server.get("stats", {}).get("openai_scheduler"):
+        print(f"scheduler: dispatched {scheduler['dispatched']}, retries {scheduler['retries']}, "
+              f"avg queue wait {scheduler['avg_wait_s']:.3f}s")
+    if stand_ins:
+        print(f"stand-ins: {stand_ins.stats()}")
+    if stalled:
+        print(f"[ERROR] {stalled}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
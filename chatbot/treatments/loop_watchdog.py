@@ -0,0 +1,143 @@
+import asyncio
+import inspect
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+import metrics
+
+# --- Opt-in event-loop stall detector (LOOP_WATCHDOG=1) ---
+# A heartbeat task measures how late the loop wakes it up (loop_lag). A thread watches the
+# heartbeat; once it is overdue by more than the threshold, the loop is blocked by whatever
+# runs on it, and the thread captures that code's stack while it is still blocking.
+LOOP_WATCHDOG = os.environ.get("LOOP_WATCHDOG", "0") == "1"
+STALL_THRESHOLD = float(os.environ.get("LOOP_STALL_MS", 100)) / 1000
+CHECK_INTERVAL = 0.05  # seconds between heartbeats and between checks of the thread
+RECENT_STALLS = 20  # stalls with stacks kept for the metrics endpoint
+STACK_LINES = 40
+
+
+class LoopStalled(AssertionError):
+    """Raised by check() when the loop was blocked, so tests and benchmarks fail on it."""
+
+
+def _blocking_coroutine(frame):
+    """Innermost coroutine on the stack - the handler that called the blocking code."""
+    while frame is not None:
+        if frame.f_code.co_flags & (inspect.CO_COROUTINE | inspect.CO_ITERABLE_COROUTINE):
+            return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = STALL_THRESHOLD, interval: float = CHECK_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.loop = None
+        self.loop_thread = None
+        self.last_beat = time.monotonic()
+        self.pending = None  # stack captured for the stall in progress
+        self.stalls = deque(maxlen=RECENT_STALLS)
+        self.stall_count = 0
+        self.max_lag = 0.0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.heartbeat = None
+
+    def start(self):
+        """Start watching the running loop; call from a coroutine on that loop."""
+        if self.heartbeat is not None and not self.heartbeat.done():
+            return self
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.stopped.clear()
+        self.heartbeat = self.loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        metrics.register("loop_watchdog", self.stats)
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - started - self.interval)
+            self.last_beat = now
+            self.max_lag = max(self.max_lag, lag)
+            metrics.observe("loop_lag", lag)
+            if lag > self.threshold:
+                self._record(lag)
+
+    def _record(self, lag: float):
+        with self.lock:
+            stall, self.pending = self.pending or {}, None
+        stall = {"time": time.time(), "seconds": round(lag, 4), **stall}
+        self.stall_count += 1
+        self.stalls.append(stall)
+        metrics.observe("loop_stall", lag)
+        print(f"[WARN] Event loop blocked for {lag * 1000:.0f} ms by {stall.get('coroutine') or 'unknown code'}")
+
+    def _watch(self):
+        while not self.stopped.wait(self.interval):
+            overdue = time.monotonic() - self.last_beat - self.interval
+            if overdue <= self.threshold:
+                continue
+            with self.lock:
+                if self.pending is not None:
+                    continue  # one stack per stall
+                frame = sys._current_frames().get(self.loop_thread)
+                if frame is None:
+                    continue
+                self.pending = {
+                    "coroutine": _blocking_coroutine(frame),
+                    "stack": traceback.format_stack(frame)[-STACK_LINES:],
+                }
+
+    def check(self):
+        """Raise LoopStalled if any stall was recorded since the last check."""
+        if self.stalls:
+            stall = self.stalls[-1]
+            count = self.stall_count
+            self.stalls.clear()
+            self.stall_count = 0
+            raise LoopStalled(
+                f"event loop blocked {count}x, last for {stall['seconds'] * 1000:.0f} ms "
+                f"in {stall.get('coroutine')}:\n" + "".join(stall.get("stack", []))
+            )
+
+    def stats(self) -> dict:
+        return {
+            "threshold_s": self.threshold,
+            "stalls": self.stall_count,
+            "max_lag_s": round(self.max_lag, 4),
+            "recent": list(self.stalls),
+        }
+
+
+_watchdog = None
+
+
+def ensure_started():
+    """Start the process-wide watchdog on the running loop if LOOP_WATCHDOG=1, else do nothing."""
+    global _watchdog
+    if not LOOP_WATCHDOG:
+        return None
+    if _watchdog is None:
+        _watchdog = LoopWatchdog()
+    return _watchdog.start()
+
+
+def check():
+    """Raise LoopStalled if the process-wide watchdog recorded a stall; nothing when it is off."""
+    if _watchdog is not None:
+        _watchdog.check()
@@ -0,0 +1,212 @@
+import contextvars
+import json
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Per-stage latency spans, aggregated per (stage, treatment) and exported for scraping ---
+# Stages: lookup, sparql (each HTTP request), llm_ttft, tool_args, retrieval_wait, followup_ttft, turn
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))  # 0 = no endpoint
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")  # 0.0.0.0 for a scraper on another host
+# Opt-in: TRACE_LOG=cache/traces.jsonl appends one JSON line per turn (no rotation, for debugging runs)
+TRACE_LOG = os.environ.get("TRACE_LOG", "")
+SAMPLE_WINDOW = 4096  # latest samples per histogram the percentiles are taken from
+QUANTILES = (0.5, 0.95, 0.99)
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Histogram:
+    """Count, sum and max of all observations, percentiles over the latest SAMPLE_WINDOW."""
+
+    def __init__(self):
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()  # the endpoint reads from its own thread
+
+    def observe(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.sum += seconds
+            self.max = max(self.max, seconds)
+
+    def quantiles(self, qs=QUANTILES) -> dict:
+        with self.lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in qs}
+        return {q: ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)] for q in qs}
+
+    def snapshot(self) -> dict:
+        quantiles = self.quantiles()
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            **{f"p{round(q * 100)}": value for q, value in quantiles.items()},
+        }
+
+
+histograms = {}  # (stage, treatment) -> Histogram
+collectors = {}  # name -> callable returning a JSON-serializable dict, for the JSON endpoint
+_histograms_lock = threading.Lock()
+
+
+def observe(stage: str, seconds: float, **attrs):
+    """Record one measurement into the histogram and into the trace of the current turn."""
+    trace = current_trace.get()
+    treatment = trace.treatment if trace is not None else "none"
+    key = (stage, treatment)
+    if key not in histograms:
+        with _histograms_lock:
+            histograms.setdefault(key, Histogram())
+    histograms[key].observe(seconds)
+    if trace is not None:
+        trace.spans.append({
+            "stage": stage,
+            "start": round(time.monotonic() - seconds - trace.started, 4),
+            "seconds": round(seconds, 4),
+            **attrs,
+        })
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    started = time.monotonic()
+    try:
+        yield
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        observe(stage, time.monotonic() - started, **attrs)
+
+
+class Trace:
+    """Spans of one turn. Every task created during the turn inherits it through the context."""
+
+    def __init__(self, treatment: str, **attrs):
+        self.treatment = treatment
+        self.attrs = attrs
+        self.started = time.monotonic()
+        self.spans = []
+        self.details = {}  # bulky per-turn data (tool payloads) for the caller, kept out of the log
+
+    def mark(self, stage: str, since: float, **attrs):
+        """Observe the time from `since` (time.monotonic()) until now, e.g. time to first token."""
+        observe(stage, time.monotonic() - since, **attrs)
+
+
+@contextmanager
+def trace_turn(treatment: str, trace: Trace = None, **attrs):
+    """Wrap one turn: sets the current trace, observes the total as 'turn' and logs the trace."""
+    if trace is None:
+        trace = Trace(treatment, **attrs)
+    token = current_trace.set(trace)
+    try:
+        with span("turn"):
+            yield trace
+    finally:
+        current_trace.reset(token)
+        _log(trace)
+
+
+_trace_queue = None
+_trace_lock = threading.Lock()
+
+
+def _log(trace: Trace):
+    """Hand the trace to the writer thread; the loop never waits on the file."""
+    global _trace_queue
+    if not TRACE_LOG:
+        return
+    line = json.dumps({
+        "time": time.time(),
+        "treatment": trace.treatment,
+        **trace.attrs,
+        "spans": trace.spans,
+    })
+    with _trace_lock:
+        if _trace_queue is None:
+            _trace_queue = queue.Queue()
+            threading.Thread(target=_write_traces, args=(_trace_queue,), name="trace-log", daemon=True).start()
+    _trace_queue.put(line)
+
+
+def _write_traces(lines: queue.Queue):
+    os.makedirs(os.path.dirname(TRACE_LOG) or ".", exist_ok=True)
+    with open(TRACE_LOG, "a") as f:
+        while True:
+            f.write(lines.get() + "\n")
+            if lines.empty():
+                f.flush()
+
+
+def register(name: str, collector):
+    collectors[name] = collector
+
+
+def snapshot() -> dict:
+    latency = {}
+    for (stage, treatment), histogram in sorted(histograms.items()):
+        latency.setdefault(stage, {})[treatment] = histogram.snapshot()
+    stats = {}
+    for name, collector in collectors.items():
+        try:
+            stats[name] = collector()
+        except Exception as e:
+            stats[name] = {"error": str(e)}
+    return {"latency_seconds": latency, "stats": stats}
+
+
+def prometheus_text() -> str:
+    lines = [
+        "# HELP chatbot_stage_seconds Latency per stage and treatment",
+        "# TYPE chatbot_stage_seconds summary",
+    ]
+    for (stage, treatment), histogram in sorted(histograms.items()):
+        labels = f'stage="{stage}",treatment="{treatment}"'
+        for q, value in histogram.quantiles().items():
+            lines.append(f'chatbot_stage_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+        lines.append(f"chatbot_stage_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+        lines.append(f"chatbot_stage_seconds_count{{{labels}}} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, content_type = json.dumps(snapshot(), default=str).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = prometheus_text().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+
+
+def serve(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread, off the event loop."""
+    global _server
+    if _server is None and port:
+        _server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    return _server
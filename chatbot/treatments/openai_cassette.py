@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import httpx
+
+from ttl_cache import CACHE_DIR
+import metrics
+
+# --- Record/replay of OpenAI API responses, as an httpx transport under AsyncOpenAI ---
+# OPENAI_CASSETTE_MODE: "" (off), "record" (always call the API and store the response),
+# "replay" (only from the store, a missing cassette is an error) or "auto" (replay, else record)
+# OPENAI_CASSETTE_SPEED: 1 replays with the original timing, 10 ten times faster, 0 without delays
+CASSETTE_MODE = os.environ.get("OPENAI_CASSETTE_MODE", "")
+CASSETTE_DIR = os.environ.get("OPENAI_CASSETTE_DIR", os.path.join(CACHE_DIR, "cassettes"))
+CASSETTE_SPEED = float(os.environ.get("OPENAI_CASSETTE_SPEED", 1.0))
+
+
+class CassetteMissing(httpx.TransportError):
+    """Replay mode got a request that was never recorded."""
+
+
+def request_key(method: str, path: str, body: bytes) -> str:
+    """Same method, endpoint and JSON body (key order aside) = same cassette; headers and host don't matter."""
+    try:
+        canonical = json.dumps(json.loads(body or b"{}"), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        canonical = body.decode("utf-8", "replace")
+    return hashlib.sha256(f"{method} {path} {canonical}".encode("utf-8")).hexdigest()
+
+
+def split_events(text: str):
+    """Complete SSE events (their data payloads) in text, and the incomplete rest."""
+    *events, rest = text.split("\n\n")
+    payloads = []
+    for event in events:
+        data = [line[5:].lstrip() for line in event.splitlines() if line.startswith("data:")]
+        if data:
+            payloads.append("\n".join(data))
+    return payloads, rest
+
+
+class CassetteStore:
+    """One JSON file per request key, so recordings of different runs can be merged by copying."""
+
+    def __init__(self, path: str = CASSETTE_DIR):
+        self.path = path
+        self.loaded = {}
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, key: str):
+        if key not in self.loaded:
+            try:
+                with open(self._file(key), encoding="utf-8") as f:
+                    self.loaded[key] = json.load(f)
+            except FileNotFoundError:
+                return None
+        return self.loaded[key]
+
+    def _write(self, key: str, cassette: dict):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._file(key) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cassette, f, indent=1, ensure_ascii=False)
+        os.replace(tmp, self._file(key))
+
+    async def put(self, key: str, cassette: dict):
+        self.loaded[key] = cassette
+        await asyncio.to_thread(self._write, key, cassette)
+
+
+class RecordingStream(httpx.AsyncByteStream):
+    """Passes the response through and keeps every SSE event with its arrival time."""
+
+    def __init__(self, stream, on_complete, started: float):
+        self.stream = stream
+        self.on_complete = on_complete
+        self.started = started
+        self.events = []  # {"t": seconds since the request was sent, "data": payload}
+        self.body = []
+        self.rest = ""
+        self.saved = False
+
+    async def __aiter__(self):
+        # the OpenAI client may iterate again to drain the connection after [DONE]
+        async for chunk in self.stream:
+            self.body.append(chunk)
+            payloads, self.rest = split_events(self.rest + chunk.decode("utf-8", "replace"))
+            t = round(time.monotonic() - self.started, 4)
+            self.events.extend({"t": t, "data": data} for data in payloads)
+            if "[DONE]" in payloads:
+                await self._complete()
+            yield chunk
+        await self._complete()
+
+    async def _complete(self):
+        # only complete responses; a stream the caller abandoned is not worth replaying
+        if not self.saved:
+            self.saved = True
+            await self.on_complete(self)
+
+    async def aclose(self):
+        await self.stream.aclose()
+
+
+class ReplayStream(httpx.AsyncByteStream):
+    def __init__(self, cassette: dict, speed: float):
+        self.cassette = cassette
+        self.speed = speed
+
+    async def __aiter__(self):
+        started = time.monotonic()
+        if "events" not in self.cassette:
+            await self._wait(self.cassette.get("t", 0), started)
+            yield self.cassette["body"].encode("utf-8")
+            return
+        for event in self.cassette["events"]:
+            await self._wait(event["t"], started)
+            yield f"data: {event['data']}\n\n".encode("utf-8")
+
+    async def _wait(self, t: float, started: float):
+        if self.speed > 0:
+            delay = t / self.speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """
+    Records chat.completions responses - every streamed chunk as sent, so tool-call deltas
+    with index/id and finish_reason come back exactly as they were - and replays them with
+    the original chunk timing divided by `speed`.
+    """
+
+    def __init__(self, mode: str = "auto", store: CassetteStore = None, speed: float = CASSETTE_SPEED,
+                 transport: httpx.AsyncBaseTransport = None):
+        self.mode = mode
+        self.store = store or CassetteStore()
+        self.speed = speed
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.hits = 0
+        self.recorded = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        key = request_key(request.method, request.url.path, body)
+        if self.mode != "record":
+            cassette = self.store.get(key)
+            if cassette is not None:
+                self.hits += 1
+                return httpx.Response(
+                    cassette["status"],
+                    headers={"content-type": cassette["content_type"]},
+                    stream=ReplayStream(cassette, self.speed),
+                    request=request,
+                )
+            if self.mode == "replay":
+                raise CassetteMissing(f"No cassette for {request.method} {request.url.path} ({key[:12]})", request=request)
+        return await self._record(request, key, body)
+
+    async def _record(self, request, key, body):
+        # uncompressed, so the recorded chunks are the SSE events themselves
+        request.headers["accept-encoding"] = "identity"
+        started = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        content_type = response.headers.get("content-type", "")
+
+        async def save(stream: RecordingStream):
+            if response.status_code >= 400:
+                return  # errors and rate limits are not part of the recording
+            cassette = {"status": response.status_code, "content_type": content_type, "request": json.loads(body or b"{}")}
+            if content_type.startswith("text/event-stream"):
+                cassette["events"] = stream.events
+            else:
+                cassette["body"] = b"".join(stream.body).decode("utf-8")
+                cassette["t"] = round(time.monotonic() - started, 4)
+            await self.store.put(key, cassette)
+            self.recorded += 1
+
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=RecordingStream(response.stream, save, started),
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "replayed": self.hits, "recorded": self.recorded}
+
+
+def http_client(mode: str = CASSETTE_MODE):
+    """httpx client for AsyncOpenAI(http_client=...) in cassette mode, None when the mode is off."""
+    if not mode:
+        return None
+    transport = CassetteTransport(mode)
+    metrics.register("openai_cassette", transport.stats)
+    return httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(600, connect=5))
@@ -0,0 +1,210 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import re
+import time
+
+import openai
+
+from payload import count_tokens
+
+# --- Rate-limit-aware scheduler for chat.completions.create, shared by all treatments ---
+
+# Requests and tokens per minute of the account tier, per model (override with OPENAI_RPM / OPENAI_TPM)
+MODEL_LIMITS = {
+    "gpt-4.1-mini-2025-04-14": {"rpm": 500, "tpm": 200000},
+}
+DEFAULT_LIMITS = {"rpm": 500, "tpm": 200000}
+
+# Lower value = served first. Follow-ups finish an answer the user is already watching.
+PRIORITY_FOLLOWUP = 0
+PRIORITY_NEW_TURN = 1
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # seconds, doubled per attempt when the headers give no hint
+BACKOFF_MAX = 30
+
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value) -> float:
+    """Parse rate-limit reset values such as '20ms', '1s' or '6m0s' into seconds."""
+    if not value:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        return sum(float(n) * DURATION_UNITS[unit] for n, unit in DURATION_RE.findall(value))
+
+
+def estimate_tokens(kwargs: dict) -> int:
+    """Prompt tokens plus the completion budget, as the API counts them against TPM."""
+    prompt = sum(
+        count_tokens(m.get("content") or "") + count_tokens(json.dumps(m.get("tool_calls", "")))
+        for m in kwargs.get("messages", [])
+    )
+    if kwargs.get("tools"):
+        prompt += count_tokens(json.dumps(kwargs["tools"]))
+    return prompt + int(kwargs.get("max_completion_tokens") or 0)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def sync(self, remaining, reset_seconds: float):
+        """Trust the server's view when it has less left than we think (other workers share the limit)."""
+        if remaining is None:
+            return
+        self._refill()
+        self.tokens = min(self.tokens, float(remaining))
+        if reset_seconds and float(remaining) <= 0:
+            self.tokens = -self.rate * reset_seconds
+
+
+class Scheduler:
+    """
+    Wraps an AsyncOpenAI client. Every create() call waits in a priority queue until the
+    model's request and token buckets allow it, is dispatched, and is retried with jittered
+    backoff on 429/5xx. The buckets are corrected from the x-ratelimit-* response headers.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.buckets = {}  # model -> (requests bucket, tokens bucket)
+        self.queue = []  # (priority, seq, future, model, estimate)
+        self.counter = itertools.count()
+        self.wakeup = None
+        self.dispatcher = None
+        self.dispatched = 0
+        self.retries = 0
+        self.total_wait = 0.0
+
+    def _buckets(self, model: str):
+        if model not in self.buckets:
+            limits = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+            rpm = float(os.environ.get("OPENAI_RPM", limits["rpm"]))
+            tpm = float(os.environ.get("OPENAI_TPM", limits["tpm"]))
+            self.buckets[model] = (TokenBucket(rpm), TokenBucket(tpm))
+        return self.buckets[model]
+
+    async def create(self, priority: int = PRIORITY_NEW_TURN, **kwargs):
+        """Drop-in for client.chat.completions.create(**kwargs), returning the same object."""
+        model = kwargs["model"]
+        estimate = estimate_tokens(kwargs)
+        for attempt in range(MAX_RETRIES + 1):
+            await self._admit(model, estimate, priority)
+            try:
+                raw = await self.client.chat.completions.with_raw_response.create(**kwargs)
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                self.retries += 1
+                headers = getattr(getattr(e, "response", None), "headers", None) or {}
+                self._sync(model, headers)
+                delay = self._backoff(attempt, headers)
+                print(f"[WARN] OpenAI {type(e).__name__}, retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                # a retried request has waited long enough - let it go first
+                priority = PRIORITY_FOLLOWUP
+                continue
+            self._sync(model, raw.headers)
+            return raw.parse()
+
+    def _backoff(self, attempt: int, headers) -> float:
+        hint = (
+            parse_duration(headers.get("retry-after-ms")) / 1000
+            or parse_duration(headers.get("retry-after"))
+            or max(parse_duration(headers.get("x-ratelimit-reset-requests")),
+                   parse_duration(headers.get("x-ratelimit-reset-tokens")))
+        )
+        delay = hint or min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+        return delay * random.uniform(1.0, 1.5)  # jitter, so queued requests don't retry in lockstep
+
+    def _sync(self, model: str, headers):
+        requests, tokens = self._buckets(model)
+        requests.sync(headers.get("x-ratelimit-remaining-requests"),
+                      parse_duration(headers.get("x-ratelimit-reset-requests")))
+        tokens.sync(headers.get("x-ratelimit-remaining-tokens"),
+                    parse_duration(headers.get("x-ratelimit-reset-tokens")))
+
+    async def _admit(self, model: str, estimate: int, priority: int):
+        loop = asyncio.get_running_loop()
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        future = loop.create_future()
+        heapq.heappush(self.queue, (priority, next(self.counter), future, model, estimate))
+        self.wakeup.set()
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        started = time.monotonic()
+        await future
+        self.total_wait += time.monotonic() - started
+
+    async def _dispatch(self):
+        while self.queue:
+            priority, seq, future, model, estimate = self.queue[0]
+            if future.cancelled():
+                heapq.heappop(self.queue)
+                continue
+            requests, tokens = self._buckets(model)
+            wait = max(requests.wait_time(1), tokens.wait_time(estimate))
+            if wait > 0:
+                # sleep until the buckets refill, or until a more urgent request arrives
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.queue)
+            requests.take(1)
+            tokens.take(estimate)
+            self.dispatched += 1
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self.queue),
+            "dispatched": self.dispatched,
+            "retries": self.retries,
+            "avg_wait_s": self.total_wait / self.dispatched if self.dispatched else 0.0,
+            "buckets": {
+                model: {"requests": round(r.tokens, 1), "tokens": round(t.tokens)}
+                for model, (r, t) in self.buckets.items()
+            },
+        }
+
+
+_schedulers = {}  # id(client) -> Scheduler; the scheduler keeps its client alive, so the id stays unique
+
+
+def get_scheduler(client) -> Scheduler:
+    """
+    One scheduler per client, so all treatments on the engine's client share the same
+    buckets and queue, while a different client (a cassette or stub) gets its own.
+    """
+    if id(client) not in _schedulers:
+        _schedulers[id(client)] = Scheduler(client)
+    return _schedulers[id(client)]
@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+
+from prefetch import guess_query
+from stub_http import StubHTTPServer, parse_latency
+
+# --- Local stand-in for the OpenAI chat.completions endpoint, for load tests without API costs ---
+# Streams answers as server-sent events with a time-to-first-token and inter-token latency
+# drawn from distributions; the RAG treatments get a dbpedia_lookup tool call on their first
+# request, as the real model does. Start it with
+#   python openai_stub.py --port 8891 --ttft lognormal:350,0.4 --rpm 500
+# and point the treatments at it with OPENAI_BASE_URL=http://127.0.0.1:8891/v1 OPENAI_API_KEY=stub
+COMPLETIONS_PATH = "/v1/chat/completions"
+ARGUMENT_PIECE = 4  # characters of the tool arguments per streamed delta, like the API
+FILLER = (
+    "Der Zweite Weltkrieg begann 1939 mit dem Überfall auf Polen . Die Achsenmächte Deutschland Italien "
+    "und Japan standen den Alliierten gegenüber , die Ursachen reichen bis zum Versailler Vertrag zurück ."
+).split()
+
+
+class OpenAIStub(StubHTTPServer):
+    """
+    Every request is counted against an optional requests-per-minute limit (429 with
+    retry-after-ms and x-ratelimit-* headers once exceeded), can fail with an injected 429
+    (rate_limit_rate) or 500 (error_rate), and is otherwise answered after its TTFT.
+    """
+
+    def __init__(self, ttft: str = "lognormal:350,0.4", inter_token: str = "fixed:12", answer_tokens: int = 120,
+                 rpm: int = 0, rate_limit_rate: float = 0.0, error_rate: float = 0.0, seed: int = None):
+        super().__init__()
+        self.ttft = parse_latency(ttft)
+        self.inter_token = parse_latency(inter_token)
+        self.answer_tokens = answer_tokens
+        self.rpm = rpm
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.window = deque()  # monotonic times of the requests admitted in the last minute
+
+    def _rate_limit_headers(self) -> dict:
+        if not self.rpm:
+            return {}
+        now = time.monotonic()
+        while self.window and now - self.window[0] >= 60:
+            self.window.popleft()
+        reset = 60 - (now - self.window[0]) if self.window else 0.0
+        return {
+            "x-ratelimit-limit-requests": str(self.rpm),
+            "x-ratelimit-remaining-requests": str(max(0, self.rpm - len(self.window))),
+            "x-ratelimit-reset-requests": f"{reset * 1000:.0f}ms",
+        }
+
+    async def respond(self, method: str, target: str, headers: dict, body: bytes):
+        if target == "/stats":
+            return "200 OK", {"Content-Type": "application/json"}, json.dumps(self.counts).encode()
+        if method != "POST" or target.split("?")[0] != COMPLETIONS_PATH:
+            return "404 Not Found", {"Content-Type": "application/json"}, b'{"error": {"message": "not found"}}'
+
+        self.counts["requests"] += 1
+        limits = self._rate_limit_headers()
+        if (self.rpm and len(self.window) >= self.rpm) or self.rng.random() < self.rate_limit_rate:
+            self.counts["rate_limited"] += 1
+            retry_after = limits.get("x-ratelimit-reset-requests", "1000ms")[:-2]
+            return "429 Too Many Requests", {
+                "Content-Type": "application/json", "retry-after-ms": retry_after, **limits,
+            }, json.dumps({"error": {"message": "Rate limit reached (stub)", "type": "requests",
+                                     "code": "rate_limit_exceeded"}}).encode()
+        if self.rng.random() < self.error_rate:
+            self.counts["errors"] += 1
+            return "500 Internal Server Error", {"Content-Type": "application/json"}, \
+                b'{"error": {"message": "injected error", "type": "server_error"}}'
+        if self.rpm:
+            self.window.append(time.monotonic())
+            limits = self._rate_limit_headers()
+
+        request = json.loads(body or b"{}")
+        completion = self._completion(request)
+        self.counts[completion["finish_reason"]] += 1
+        if request.get("stream"):
+            return "200 OK", {"Content-Type": "text/event-stream", **limits}, self._stream(request, completion)
+
+        await asyncio.sleep(self.ttft(self.rng) + self.inter_token(self.rng) * len(completion["pieces"]))
+        message = {"role": "assistant", "content": "".join(completion["pieces"]) or None}
+        if completion["tool_call"]:
+            message["tool_calls"] = [completion["tool_call"]]
+        return "200 OK", {"Content-Type": "application/json", **limits}, json.dumps({
+            **self._envelope(request, "chat.completion"),
+            "choices": [{"index": 0, "message": message, "finish_reason": completion["finish_reason"]}],
+            "usage": self._usage(request, completion),
+        }).encode()
+
+    def _completion(self, request: dict) -> dict:
+        """A tool call when the model would make one (tools offered, no tool results yet), else an answer."""
+        messages = request.get("messages", [])
+        wants_tool = (
+            request.get("tools") and request.get("tool_choice") != "none"
+            and not any(m.get("role") == "tool" for m in messages)
+        )
+        if wants_tool:
+            user_text = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+            arguments = json.dumps({"query": guess_query(user_text), "max_results": 3})
+            call = {"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+                    "function": {"name": "dbpedia_lookup", "arguments": arguments}}
+            return {"pieces": [], "tool_call": call, "finish_reason": "tool_calls"}
+        limit = int(request.get("max_completion_tokens") or request.get("max_tokens") or self.answer_tokens)
+        count = min(limit, self.answer_tokens)
+        pieces = [(" " if i else "") + FILLER[i % len(FILLER)] for i in range(count)]
+        return {"pieces": pieces, "tool_call": None, "finish_reason": "stop" if count < limit else "length"}
+
+    @staticmethod
+    def _envelope(request: dict, kind: str) -> dict:
+        return {"id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "object": kind, "created": int(time.time()),
+                "model": request.get("model", "stub")}
+
+    @staticmethod
+    def _usage(request: dict, completion: dict) -> dict:
+        prompt = sum(len((m.get("content") or "").split()) for m in request.get("messages", []))
+        output = len(completion["pieces"]) or len(json.dumps(completion["tool_call"]).split())
+        return {"prompt_tokens": prompt, "completion_tokens": output, "total_tokens": prompt + output}
+
+    async def _stream(self, request: dict, completion: dict):
+        envelope = self._envelope(request, "chat.completion.chunk")
+
+        def event(delta: dict, finish_reason=None) -> bytes:
+            chunk = {**envelope, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+        await asyncio.sleep(self.ttft(self.rng))
+        yield event({"role": "assistant", "content": ""})
+        if call := completion["tool_call"]:
+            arguments = call["function"]["arguments"]
+            yield event({"tool_calls": [{"index": 0, "id": call["id"], "type": "function",
+                                         "function": {"name": call["function"]["name"], "arguments": ""}}]})
+            for i in range(0, len(arguments), ARGUMENT_PIECE):
+                await asyncio.sleep(self.inter_token(self.rng))
+                yield event({"tool_calls": [{"index": 0, "function": {"arguments": arguments[i:i + ARGUMENT_PIECE]}}]})
+        for i, piece in enumerate(completion["pieces"]):
+            if i:
+                await asyncio.sleep(self.inter_token(self.rng))
+            yield event({"content": piece})
+        yield event({}, completion["finish_reason"])
+        yield b"data: [DONE]\n\n"
+
+
+async def _serve(args):
+    stub = OpenAIStub(
+        ttft=args.ttft,
+        inter_token=args.inter_token,
+        answer_tokens=args.answer_tokens,
+        rpm=args.rpm,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    await stub.start(args.host, args.port)
+    print(f"OpenAI stand-in on {stub.base_url}/v1")
+    await stub.server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI chat.completions stand-in for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8891)
+    parser.add_argument("--ttft", default="lognormal:350,0.4", help="none | fixed:MS | uniform:MIN,MAX | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--inter-token", default="fixed:12", help="delay between streamed tokens, same forms")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before answering 429 (0 = no limit)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--seed", type=int, default=None)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
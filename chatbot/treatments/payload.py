@@ -0,0 +1,114 @@
+import json
+import os
+import re
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")  # tokenizer of the gpt-4.1 family
+except ImportError:  # rough estimate without tiktoken
+    _encoding = None
+
+# --- Token-budgeted compaction of the DBpedia tool payload ---
+TOKEN_BUDGET = int(os.environ.get("DBPEDIA_TOKEN_BUDGET", 1500))  # per tool call
+
+PREFIXES = {
+    "http://dbpedia.org/ontology/": "dbo:",
+    "http://dbpedia.org/property/": "dbp:",
+    "http://dbpedia.org/resource/": "dbr:",
+}
+# Spelled out in the payload, so the model can turn dbr: values back into links
+RESOURCE_NAMESPACE = {"dbr:": "http://dbpedia.org/resource/"}
+
+# Compaction steps, applied in order until the payload fits:
+# (max abstract characters, max values per property, max properties per entity)
+STEPS = [
+    (None, 5, 5),
+    (1200, 5, 5),
+    (800, 3, 5),
+    (500, 3, 5),
+    (300, 2, 3),
+    (150, 1, 3),
+    (150, 1, 0),
+]
+
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def shorten_uri(uri: str) -> str:
+    for namespace, prefix in PREFIXES.items():
+        if uri.startswith(namespace):
+            return prefix + uri[len(namespace):]
+    return uri
+
+
+def truncate_sentences(text: str, max_chars) -> str:
+    """Cut text to at most max_chars, at the last sentence boundary if there is one."""
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    ends = [m.start() for m in SENTENCE_END_RE.finditer(cut)]
+    if ends:
+        return cut[:ends[-1]]
+    return cut.rsplit(" ", 1)[0] + " …"
+
+
+def compact_value(value):
+    """Resource values as 'Label (dbr:Name)', or 'dbr:Name' without a label; literals unchanged."""
+    if isinstance(value, dict):
+        return f"{value.get('label', '')} ({shorten_uri(value.get('uri', ''))})"
+    if isinstance(value, str):
+        return shorten_uri(value)
+    return value
+
+
+def _compact_entity(entity: dict, max_chars, max_values, max_props) -> dict:
+    compact = {
+        "entity": entity.get("entity", ""),
+        "label": entity.get("label", ""),
+        "description": entity.get("description", ""),
+        "abstract": truncate_sentences(entity.get("abstract", ""), max_chars),
+        "properties": {
+            shorten_uri(p): [compact_value(v) for v in values[:max_values]]
+            for p, values in list(entity.get("properties", {}).items())[:max_props]
+        },
+    }
+    return {k: v for k, v in compact.items() if v or k == "entity"}
+
+
+def _dump(results) -> str:
+    return json.dumps(
+        {"prefixes": RESOURCE_NAMESPACE, "dbpedia_results": results}, separators=(",", ":"), ensure_ascii=False
+    )
+
+
+def compact_tool_content(results, token_budget: int = TOKEN_BUDGET):
+    """
+    Turn parsed dbpedia_lookup results into the tool message content: compact JSON,
+    ontology URIs as dbo:/dbp: prefixes, resource values as "Label (dbr:Name)" (the entity
+    URI itself stays in full), abstracts cut at sentence boundaries and
+    properties trimmed step by step until the payload fits the token budget. As a last
+    resort, lower-ranked entities are dropped. Returns (content, token_count).
+    """
+    if not isinstance(results, list):
+        content = json.dumps({"dbpedia_results": results}, separators=(",", ":"), ensure_ascii=False)
+        return content, count_tokens(content)
+
+    for max_chars, max_values, max_props in STEPS:
+        compact = [_compact_entity(e, max_chars, max_values, max_props) for e in results]
+        content = _dump(compact)
+        tokens = count_tokens(content)
+        if tokens <= token_budget:
+            return content, tokens
+
+    # Still too large: keep the top-ranked entities only
+    while len(compact) > 1 and tokens > token_budget:
+        compact.pop()
+        content = _dump(compact)
+        tokens = count_tokens(content)
+    return content, tokens
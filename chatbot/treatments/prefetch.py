@@ -0,0 +1,112 @@
+import asyncio
+import os
+import re
+
+from dbpedia_lookup import dbpedia_lookup
+
+# --- DBpedia prefetch, started while the first model call is still running ---
+SPECULATIVE_PREFETCH = os.environ.get("DBPEDIA_SPECULATIVE_PREFETCH", "0") == "1"
+MIN_OVERLAP = 0.5  # share of terms the model's query and the guess must have in common
+
+STOPWORDS = {
+    "a", "about", "after", "all", "also", "an", "and", "any", "are", "as", "at", "be", "been",
+    "before", "between", "but", "by", "can", "could", "describe", "did", "do", "does", "during",
+    "explain", "for", "from", "give", "had", "has", "have", "how", "i", "in", "into", "is", "it",
+    "its", "me", "my", "of", "on", "or", "please", "tell", "that", "the", "their", "them", "there",
+    "these", "they", "this", "those", "to", "under", "was", "we", "were", "what", "when", "where",
+    "which", "while", "who", "whom", "whose", "why", "will", "with", "would", "you", "your",
+}
+
+WORD_RE = re.compile(r"[\w'’-]+")
+
+
+def terms(text: str) -> set:
+    return {w.lower() for w in WORD_RE.findall(text or "") if w.lower() not in STOPWORDS}
+
+
+def guess_query(text: str) -> str:
+    """
+    Guess the Lookup query the model will ask for: capitalized spans ("World War II")
+    when there are any, otherwise all content words of the message.
+    """
+    words = WORD_RE.findall(text or "")
+    spans, current = [], []
+    for word in words:
+        if word[0].isupper() and word.lower() not in STOPWORDS:
+            current.append(word)
+        elif current and word.lower() == "of":  # "Battle of Britain"
+            current.append(word)
+        else:
+            if current:
+                spans.append(current)
+            current = []
+    if current:
+        spans.append(current)
+    spans = [s[:-1] if s[-1] == "of" else s for s in spans]
+    if spans:
+        return " ".join(" ".join(s) for s in spans)
+    return " ".join(w for w in words if w.lower() not in STOPWORDS)
+
+
+def overlap(a: str, b: str) -> float:
+    ta, tb = terms(a), terms(b)
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+class LookupPrefetch:
+    """
+    Holds the in-flight dbpedia_lookups of one turn: a speculative guess from the user
+    message (start) and the model's own queries as soon as they are streamed (start_query).
+    result_for() reuses a running lookup when the model's final query is close enough,
+    otherwise it runs the real query. cancel() drops whatever was not used.
+    All lookups share the deadline of the turn, which the caller sets before the first one.
+    """
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self.entries = []  # [{"query", "max_results", "task", "speculative"}]
+
+    def start(self, text: str, max_results: int = 3):
+        self._launch(guess_query(text), max_results, speculative=True)
+
+    def start_query(self, query: str, max_results: int = 3):
+        """Start the lookup for the model's query, unless a running one already covers it."""
+        if self._find(query, max_results) is not None:
+            return
+        # the guess was wrong - stop it before it puts load on the endpoint
+        for entry in [e for e in self.entries if e["speculative"]]:
+            entry["task"].cancel()
+            self.entries.remove(entry)
+        self._launch(query, max_results, speculative=False)
+
+    async def result_for(self, query: str, max_results: int = 3) -> str:
+        entry = self._find(query, max_results)
+        if entry is not None:
+            self.entries.remove(entry)
+            print(f"[DEBUG] Using prefetched lookup for '{entry['query']}' (model asked '{query}')")
+            return await entry["task"]
+        return await dbpedia_lookup(query, max_results, self.deadline)
+
+    def cancel(self):
+        for entry in self.entries:
+            entry["task"].cancel()
+        self.entries = []
+
+    def _find(self, query: str, max_results: int):
+        for entry in self.entries:
+            if max_results == entry["max_results"] and (
+                query.lower() == entry["query"].lower() or overlap(query, entry["query"]) >= MIN_OVERLAP
+            ):
+                return entry
+        return None
+
+    def _launch(self, query: str, max_results: int, speculative: bool):
+        if query:
+            self.entries.append({
+                "query": query,
+                "max_results": max_results,
+                "task": asyncio.create_task(dbpedia_lookup(query, max_results, self.deadline)),
+                "speculative": speculative,
+            })
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+
+from ttl_cache import CACHE_DIR
+
+# --- Pluggable, append-only store for conversation histories (shared by all workers) ---
+# SESSION_STORE="sqlite" (default, one file per host) or "redis" (SESSION_STORE_URL, across nodes)
+SESSION_STORE = os.environ.get("SESSION_STORE", "sqlite")
+SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH", os.path.join(CACHE_DIR, "sessions.sqlite3"))
+SESSION_STORE_URL = os.environ.get("SESSION_STORE_URL", "redis://localhost:6379/0")
+SESSION_TTL = 1296000  # 15 days, same as user_session_timeout in .chainlit/config.toml
+
+ROLES = ["system", "user", "assistant", "tool"]
+COMPRESSED = 0x80  # flag bit in the header byte
+COMPRESS_FROM = 512  # bytes; shorter messages are not worth it
+
+
+def encode_message(role: str, content: str) -> bytes:
+    """One header byte (role index + compression flag) followed by the UTF-8 content."""
+    data = content.encode("utf-8")
+    header = ROLES.index(role)
+    if len(data) >= COMPRESS_FROM:
+        packed = zlib.compress(data, 6)
+        if len(packed) < len(data):
+            data, header = packed, header | COMPRESSED
+    return struct.pack("B", header) + data
+
+
+def decode_message(blob: bytes):
+    header, data = blob[0], blob[1:]
+    if header & COMPRESSED:
+        data = zlib.decompress(data)
+    return ROLES[header & ~COMPRESSED], data.decode("utf-8")
+
+
+class SQLiteSessionStore:
+    """One row per message, appended per turn; a session is a primary-key range."""
+
+    def __init__(self, path: str = SESSION_STORE_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                ) WITHOUT ROWID"""
+            )
+        return self._conn
+
+    def _append(self, session_id, blob):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO messages (session_id, seq, data) VALUES "
+                "(?, (SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?), ?)",
+                (session_id, session_id, blob),
+            )
+
+    def _count(self, session_id):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row[0]
+
+    def _tail(self, session_id, limit):
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT data FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, limit),
+            ).fetchall()
+        return [decode_message(row[0]) for row in reversed(rows)]
+
+    # Disk writes run in a thread so a slow fsync never blocks the event loop
+    async def append(self, session_id: str, role: str, content: str):
+        await asyncio.to_thread(self._append, session_id, encode_message(role, content))
+
+    async def count(self, session_id: str) -> int:
+        return await asyncio.to_thread(self._count, session_id)
+
+    async def tail(self, session_id: str, limit: int):
+        return await asyncio.to_thread(self._tail, session_id, limit)
+
+
+class RedisSessionStore:
+    """A Redis list per session (RPUSH per message), expiring with the Chainlit session."""
+
+    def __init__(self, url: str = SESSION_STORE_URL):
+        import redis.asyncio as redis  # optional dependency, only needed for this backend
+        self.redis = redis.from_url(url)
+
+    @staticmethod
+    def _key(session_id):
+        return f"chat:history:{session_id}"
+
+    async def append(self, session_id: str, role: str, content: str):
+        key = self._key(session_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.rpush(key, encode_message(role, content))
+            pipe.expire(key, SESSION_TTL)
+            await pipe.execute()
+
+    async def count(self, session_id: str) -> int:
+        return await self.redis.llen(self._key(session_id))
+
+    async def tail(self, session_id: str, limit: int):
+        blobs = await self.redis.lrange(self._key(session_id), -limit, -1)
+        return [decode_message(blob) for blob in blobs]
+
+
+_store = None
+
+
+def get_session_store():
+    global _store
+    if _store is None:
+        if SESSION_STORE == "redis":
+            _store = RedisSessionStore(SESSION_STORE_URL)
+        else:
+            _store = SQLiteSessionStore(SESSION_STORE_PATH)
+    return _store
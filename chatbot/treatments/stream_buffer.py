@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+# --- Coalesced token streaming: fewer websocket emits per answer ---
+STREAM_COALESCE = os.environ.get("STREAM_COALESCE", "1") == "1"
+FLUSH_WINDOW = float(os.environ.get("STREAM_FLUSH_MS", 40)) / 1000  # seconds a token may wait
+FLUSH_BYTES = int(os.environ.get("STREAM_FLUSH_BYTES", 192))  # flush at once beyond this buffer size
+
+
+class CoalescedStream:
+    """
+    Wraps a cl.Message (or anything with stream_token()/update()) and keeps its API.
+    Tokens are buffered and emitted together once FLUSH_WINDOW has passed since the first
+    buffered token or the buffer holds FLUSH_BYTES, so a 300-token answer costs a few dozen
+    emits instead of 300. flush() empties the buffer at once, e.g. on finish_reason.
+    """
+
+    def __init__(self, msg, window: float = FLUSH_WINDOW, max_bytes: int = FLUSH_BYTES):
+        self.msg = msg
+        self.window = window
+        self.max_bytes = max_bytes
+        self.buffer = []
+        self.size = 0
+        self.timer = None
+        self.lock = asyncio.Lock()  # keeps emits in order when the timer and a token flush at once
+        self.tokens = 0
+        self.emits = 0
+
+    async def stream_token(self, token: str):
+        if not token:
+            return
+        self.buffer.append(token)
+        self.size += len(token.encode("utf-8"))
+        self.tokens += 1
+        if self.size >= self.max_bytes:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self.timer = None
+        await self._emit()
+
+    async def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        await self._emit()
+
+    async def _emit(self):
+        if not self.buffer:
+            return
+        text = "".join(self.buffer)
+        self.buffer.clear()
+        self.size = 0
+        async with self.lock:
+            self.emits += 1
+            await self.msg.stream_token(text)
+
+    async def update(self):
+        await self.flush()
+        return await self.msg.update()
+
+    def __getattr__(self, name):
+        # content, id, send(), ... of the wrapped message
+        return getattr(self.msg, name)
+
+
+def coalesced(msg):
+    """Wrap msg once; with STREAM_COALESCE=0 every token is emitted on its own, as before."""
+    if isinstance(msg, CoalescedStream):
+        return msg
+    return CoalescedStream(msg) if STREAM_COALESCE else CoalescedStream(msg, max_bytes=0)
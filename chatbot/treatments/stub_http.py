@@ -0,0 +1,96 @@
+import asyncio
+from collections import defaultdict
+
+# --- Minimal asyncio HTTP/1.1 server shared by the local stand-ins (DBpedia, OpenAI) ---
+
+
+def parse_latency(spec: str):
+    """
+    Latency distribution from a spec, as a function rng -> seconds:
+    "none", "fixed:MS", "uniform:MIN_MS,MAX_MS" or "lognormal:MEDIAN_MS,SIGMA" (long tail).
+    """
+    kind, _, args = (spec or "none").partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "none":
+        return lambda rng: 0.0
+    if kind == "fixed":
+        return lambda rng: values[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda rng: median * rng.lognormvariate(0, sigma) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubHTTPServer:
+    """
+    Keep-alive HTTP/1.1 on asyncio streams, so thousands of slow requests cost no threads.
+    Subclasses implement respond(method, target, headers, body) and return None (hang up
+    without an answer) or (status, headers, body); a body that is an async iterator of
+    bytes is sent chunked, piece by piece, e.g. a server-sent event stream.
+    """
+
+    def __init__(self):
+        self.server = None
+        self.connections = set()
+        self.counts = defaultdict(int)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self.server = await asyncio.start_server(self._connection, host, port)
+        return self
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            for writer in list(self.connections):
+                writer.close()
+            await self.server.wait_closed()
+
+    async def respond(self, method: str, target: str, headers: dict, body: bytes):
+        raise NotImplementedError
+
+    async def _connection(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _version = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = b""
+                if length := int(headers.get("content-length", 0)):
+                    body = await reader.readexactly(length)
+
+                response = await self.respond(method, target, headers, body)
+                if response is None:
+                    break  # injected timeout: close without an answer
+                status, response_headers, content = response
+                head = f"HTTP/1.1 {status}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in response_headers.items())
+                if isinstance(content, bytes):
+                    writer.write(f"{head}Content-Length: {len(content)}\r\n\r\n".encode("latin-1") + content)
+                else:
+                    writer.write(f"{head}Transfer-Encoding: chunked\r\n\r\n".encode("latin-1"))
+                    async for piece in content:
+                        writer.write(f"{len(piece):x}\r\n".encode("latin-1") + piece + b"\r\n")
+                        await writer.drain()
+                    writer.write(b"0\r\n\r\n")
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass  # server shut down while the client kept the connection open
+        finally:
+            self.connections.discard(writer)
+            writer.close()
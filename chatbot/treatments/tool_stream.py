@@ -0,0 +1,142 @@
+import json
+from types import SimpleNamespace
+
+# --- Incremental parsing of streamed tool-call arguments ---
+
+
+class ArgumentScanner:
+    """
+    Scans the JSON object of a tool call's arguments while it is being streamed and
+    calls on_field(key, value) as soon as a top-level field is complete, e.g. the
+    "query" string, without waiting for the closing brace or finish_reason.
+    """
+
+    def __init__(self, on_field):
+        self.on_field = on_field
+        self.fields = {}
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.state = "start"  # start, key, colon, value, string, scalar, nested, comma, done
+        self.key = None
+        self.start = 0
+
+    def feed(self, text: str):
+        self.buffer += text
+        buffer = self.buffer
+        for i in range(self.pos, len(buffer)):
+            c = buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif c == "\\":
+                    self.escaped = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.state == "key":
+                        self.key = json.loads(buffer[self.start:i + 1])
+                        self.state = "colon"
+                    elif self.depth == 1 and self.state == "string":
+                        self._emit(buffer[self.start:i + 1])
+                continue
+
+            if c == '"':
+                self.in_string = True
+                if self.depth == 1 and self.state in ("key", "value"):
+                    self.start = i
+                    self.state = "key" if self.state == "key" else "string"
+            elif c in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.state = "key"
+                elif self.depth == 2 and self.state == "value":
+                    self.start = i
+                    self.state = "nested"
+            elif c in "}]":
+                self.depth -= 1
+                if self.depth == 1 and self.state == "nested":
+                    self._emit(buffer[self.start:i + 1])
+                elif self.depth == 0:
+                    if self.state == "scalar":
+                        self._emit(buffer[self.start:i])
+                    self.state = "done"
+            elif self.depth == 1:
+                if c == ":" and self.state == "colon":
+                    self.state = "value"
+                elif c == ",":
+                    if self.state == "scalar":
+                        self._emit(buffer[self.start:i])
+                    self.state = "key"
+                elif not c.isspace() and self.state == "value":
+                    self.start = i
+                    self.state = "scalar"
+        self.pos = len(buffer)
+
+    def _emit(self, raw: str):
+        self.state = "comma"
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        self.fields[self.key] = value
+        self.on_field(self.key, value)
+
+
+class ToolCallAccumulator:
+    """
+    Collects streamed tool-call deltas by their index (stable across deltas) and scans
+    the arguments as they arrive. on_field(slot, key, value) fires once per completed
+    top-level argument. Usable by any treatment that declares tools in its settings.
+    """
+
+    def __init__(self, on_field=None):
+        self.on_field = on_field
+        self.calls = {}  # idx -> {"id": None|str, "name": None|str, "arguments": str, "fields": dict}
+
+    def add(self, tool_call_deltas):
+        for tc in tool_call_deltas:
+            idx = tc.index
+            slot = self.calls.get(idx)
+            if slot is None:
+                slot = {"id": None, "name": None, "arguments": "", "fields": {}}
+                scanner = ArgumentScanner(lambda key, value, slot=slot: self._field(slot, key, value))
+                slot["fields"] = scanner.fields
+                slot["scanner"] = scanner
+                self.calls[idx] = slot
+            if getattr(tc, "id", None):
+                slot["id"] = tc.id
+            if getattr(tc, "function", None):
+                if getattr(tc.function, "name", None):
+                    slot["name"] = tc.function.name
+                if getattr(tc.function, "arguments", None):
+                    slot["arguments"] += tc.function.arguments
+                    slot["scanner"].feed(tc.function.arguments)
+
+    def to_cache(self):
+        return [
+            {"index": idx, "id": slot["id"], "name": slot["name"], "arguments": slot["arguments"]}
+            for idx, slot in self.items()
+        ]
+
+    def restore(self, calls):
+        """Feed tool calls from the answer cache through add(), as if they had been streamed."""
+        self.add(
+            SimpleNamespace(
+                index=call["index"],
+                id=call["id"],
+                function=SimpleNamespace(name=call["name"], arguments=call["arguments"]),
+            )
+            for call in calls
+        )
+
+    def _field(self, slot, key, value):
+        if self.on_field is not None:
+            self.on_field(slot, key, value)
+
+    def items(self):
+        return sorted(self.calls.items())
+
+    def __bool__(self):
+        return bool(self.calls)
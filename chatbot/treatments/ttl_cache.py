@@ -0,0 +1,192 @@
+import asyncio
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# --- Two-tier cache: in-process LRU with TTL, backed by SQLite on disk ---
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+READ_BATCH = 500  # keys per disk query, below SQLite's limit on bound parameters
+WRITE_BATCH = 500  # queued writes per transaction
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def _connect(path: str):
+    """One shared connection per database file (several namespaces live in one file)."""
+    with _connections_lock:
+        if path not in _connections:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )"""
+            )
+            _connections[path] = (conn, threading.Lock())
+        return _connections[path]
+
+
+_writers = {}
+
+
+def _writer(path: str) -> queue.Queue:
+    """
+    Queue of a background thread that applies the writes to one database file, a batch per
+    transaction, so a slow commit or WAL checkpoint never blocks the event loop.
+    """
+    with _connections_lock:
+        if path not in _writers:
+            _writers[path] = queue.Queue()
+            threading.Thread(target=_write_loop, args=(path, _writers[path]), name="cache-writer", daemon=True).start()
+        return _writers[path]
+
+
+@atexit.register
+def _flush_writers():
+    """Apply the writes still queued when the process exits normally."""
+    for writes in list(_writers.values()):
+        writes.join()
+
+
+def _write_loop(path: str, writes: queue.Queue):
+    while True:
+        batch = [writes.get()]
+        while not writes.empty() and len(batch) < WRITE_BATCH:
+            batch.append(writes.get_nowait())
+        conn = None
+        try:
+            # connected here, so a cache dir or file that can't be opened only drops this batch
+            conn, lock = _connect(path)
+            with lock:
+                conn.execute("BEGIN")
+                for sql, params in batch:
+                    conn.execute(sql, params)
+                conn.execute("COMMIT")
+        except Exception as e:
+            print(f"[ERROR] Cache write to {path} failed: {e}")
+            if conn is not None:
+                with lock:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+        finally:
+            for _ in batch:
+                writes.task_done()
+
+
+class TwoTierCache:
+    """
+    LRU cache with a size cap and TTL. Misses in memory fall through to an optional
+    SQLite store, so entries survive worker restarts. Values must be JSON-serializable.
+    The memory tier answers synchronously; disk reads run in a worker thread and disk
+    writes are queued to the background writer, so the event loop never waits on SQLite.
+    """
+
+    def __init__(self, namespace: str, path: str = None, max_entries: int = 1024, ttl: float = 86400):
+        self.namespace = namespace
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (expires, value)
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def _memory_get(self, key: str, now: float):
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._memory.move_to_end(key)
+                return entry[1]
+            del self._memory[key]
+        return None
+
+    def _read(self, keys):
+        conn, lock = _connect(self.path)
+        rows = []
+        with lock:
+            for i in range(0, len(keys), READ_BATCH):
+                chunk = keys[i:i + READ_BATCH]
+                rows += conn.execute(
+                    f"SELECT key, value, expires FROM cache WHERE namespace = ? AND key IN ({','.join('?' * len(chunk))})",
+                    (self.namespace, *chunk),
+                ).fetchall()
+        return rows
+
+    async def get(self, key: str):
+        return (await self.get_many([key])).get(key)
+
+    async def get_many(self, keys) -> dict:
+        """Values of the keys found, from memory, else with one disk query for all the rest."""
+        now = time.time()
+        found, missing = {}, []
+        for key in keys:
+            value = self._memory_get(key, now)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        self.hits_memory += len(found)
+
+        if missing and self.path:
+            rows = await asyncio.to_thread(self._read, missing)
+            for key, value, expires in rows:
+                if expires > now:
+                    found[key] = json.loads(value)
+                    self._remember(key, found[key], expires)
+                    self.hits_disk += 1
+
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value):
+        expires = time.time() + self.ttl
+        self._remember(key, value, expires)
+        if self.path:
+            _writer(self.path).put((
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), expires),
+            ))
+
+    def _remember(self, key, value, expires):
+        if self.max_entries <= 0:
+            return  # memory tier turned off
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def purge_expired(self):
+        """Drop expired rows from disk; memory entries expire lazily on access."""
+        if self.path:
+            _writer(self.path).put((
+                "DELETE FROM cache WHERE namespace = ? AND expires <= ?",
+                (self.namespace, time.time()),
+            ))
+
+    def flush(self):
+        """Block until the queued disk writes are applied, e.g. before the process exits."""
+        if self.path:
+            _writer(self.path).join()
+
+    def stats(self) -> dict:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "namespace": self.namespace,
+            "entries_in_memory": len(self._memory),
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+        }